@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, redirect, url_for, make_response, jsonify, send_file, send_from_directory
-from .functions import cookie_handler, db_handler
+from .functions import cookie_handler, db_handler, asset_handler
 from .functions.AI_handler import AIHandler 
+from .routes import main_bp, auth_bp, admin_bp, api_bp, jobs_bp, assets_bp
 import os
 from dotenv import load_dotenv
 import io
@@ -10,6 +11,15 @@ from piper.voice import PiperVoice
 load_dotenv()
 
 app = Flask(__name__)
+# Sessions carry the admin login, so a guessable key is only allowed while
+# debugging (FLASK_DEBUG=1, or `python -m application.app`)
+app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+if not app.secret_key:
+    if not (app.debug or __name__ == '__main__'):
+        raise RuntimeError("FLASK_SECRET_KEY is not set; set it (e.g. in application/.env) or run with FLASK_DEBUG=1")
+    app.secret_key = "dev-secret-key"
+# Reject oversized requests (audio/image uploads to /bot) before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_MB", "25")) * 1024 * 1024
 
 # Initialize DB on startup
 db_handler.init_db()
@@ -54,70 +64,6 @@ def bot():
 
     return render_template('bot.html')
 
-@app.route('/admin')
-def admin():
-    # Allow optional ?user_id=... to view other users (admin use)
-    user_id = request.args.get('user_id') or request.cookies.get("user_id")
-    if not user_id:
-        return "No user_id provided or cookie set."
-
-    # Get the full chat history (no limit)
-    events = db_handler.get_events(user_id, limit=500)  # adjust limit as needed
-
-    # Format into a readable transcript
-    transcript = []
-    for event_type, content, timestamp in events[::-1]:  # reverse so oldest first
-        if event_type == "chat_user":
-            transcript.append(f"<b>User:</b> {content} <small>({timestamp})</small>")
-        elif event_type == "chat_llm":
-            transcript.append(f"<b>Assistant:</b> {content} <small>({timestamp})</small>")
-        elif event_type == "annotation":
-            transcript.append(f"<i>[Annotation]</i> {content} <small>({timestamp})</small>")
-        else:
-            transcript.append(f"[{event_type}] {content} <small>({timestamp})</small>")
-
-    return render_template('admin.html', transcript=transcript)
-
-
-@app.route('/admin/users')
-def admin_users():
-    # return JSON list of users
-    users = db_handler.list_users()
-    return jsonify([{"id": u[0], "info": u[1]} for u in users])
-
-
-@app.route('/admin/export')
-def admin_export():
-    # export events as CSV for a given user_id (query param or cookie)
-    user_id = request.args.get('user_id') or request.cookies.get('user_id')
-    if not user_id:
-        return "No user_id provided", 400
-
-    events = db_handler.get_events(user_id, limit=10000)
-    # events: list of (event_type, content, timestamp)
-    import io, csv
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['event_type', 'content', 'timestamp'])
-    for et, content, ts in events[::-1]:  # oldest first
-        writer.writerow([et, content, ts])
-
-    resp = make_response(output.getvalue())
-    resp.headers['Content-Type'] = 'text/csv'
-    resp.headers['Content-Disposition'] = f'attachment; filename=events_{user_id}.csv'
-    return resp
-
-
-@app.route('/admin/clear', methods=['POST'])
-def admin_clear():
-    # clear events for provided user_id (form or JSON) or cookie
-    user_id = request.form.get('user_id') or (request.get_json() or {}).get('user_id') or request.cookies.get('user_id')
-    if not user_id:
-        return jsonify({'ok': False, 'error': 'no user_id provided'}), 400
-    db_handler.clear_events(user_id)
-    return jsonify({'ok': True})
-
-
 @app.route('/info')
 def info():
     """Render the info page (template may be empty for now)."""
@@ -148,7 +94,8 @@ def ai_status():
 
 @app.route('/img/<path:filename>')
 def img_file(filename):
-    return send_from_directory('img', filename)
+    # Unversioned URL: let browsers reuse it for a day, then revalidate (ETag)
+    return send_from_directory('img', filename, max_age=86400)
 
 
 @app.route('/tts', methods=['POST'])
@@ -181,5 +128,24 @@ def page_not_found(e):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": "Uppladdningen är för stor"}), 413
+
+
+# Register blueprints after the routes above so those keep precedence where
+# paths overlap; all /admin routes live in the admin blueprint, behind
+# admin_required.
+app.register_blueprint(main_bp)
+app.register_blueprint(auth_bp)
+app.register_blueprint(admin_bp)
+app.register_blueprint(api_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(assets_bp)
+
+# Hash and precompress static assets once at startup (before gunicorn forks)
+asset_handler.manifest.build()
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,8 +1,23 @@
 import os
+import threading
+import time
+import uuid
 from typing import Optional, Dict, Any
+import httpx
 import ollama
 import logging
 from . import db_handler
+from . import image_handler
+from . import routing
+from . import context_cache
+from .deadline import Deadline, Cancelled, DeadlineExceeded, in_flight, metrics, parse_timeouts
+
+# Whisper models are expensive to load, so keep one per process and share it
+# between AIHandler instances and request threads.
+_whisper_models: Dict[str, Any] = {}
+_whisper_lock = threading.Lock()
+
+SYSTEM_PROMPT = "Your name is Kjell, you are a wise and friendly medieval knight, an all-knowing AI assistant who helps users with their questions."
 
 class AIHandler:
     def __init__(self, config: Optional[Dict[str, Any]] = None) -> None:
@@ -18,20 +33,213 @@ class AIHandler:
             or os.environ.get("OLLAMA_REASON_MODEL")
             or "phi4-reasoning:14b"
         )
+        self.small_chat_model = (
+            self.config.get("small_chat_model")
+            or os.environ.get("OLLAMA_SMALL_MODEL")
+            or "llama3.2:3b"
+        )
+        # Route each /bot turn to a small, medium or reasoning model, and
+        # retry weak small-model answers on the medium model (cascade)
+        self.routing_enabled = str(
+            self.config.get("routing", os.environ.get("MODEL_ROUTING", "1"))
+        ).lower() in ("1", "true", "yes")
+        self.cascade_enabled = str(
+            self.config.get("cascade", os.environ.get("MODEL_CASCADE", "1"))
+        ).lower() in ("1", "true", "yes")
+        # Hand very long turns (long messages, code blocks) to the background
+        # job queue instead of generating inside the request; turns posted
+        # with async=1 are always handed off
+        self.job_handoff = str(
+            self.config.get("job_handoff", os.environ.get("JOBS_HANDOFF", "0"))
+        ).lower() in ("1", "true", "yes")
+        # Continue conversations from the model's stored context instead of
+        # replaying the system prompt and history every turn
+        self.context_reuse = str(
+            self.config.get("context_reuse", os.environ.get("OLLAMA_CONTEXT_REUSE", "0"))
+        ).lower() in ("1", "true", "yes")
+        self.context_max_tokens = int(
+            self.config.get("context_max_tokens")
+            or os.environ.get("OLLAMA_CONTEXT_MAX_TOKENS")
+            or 3072
+        )
+        self.vision_model = (
+            self.config.get("vision_model")
+            or os.environ.get("OLLAMA_VISION_MODEL")
+            or "llava:13b"
+        )
+        self.whisper_model = (
+            self.config.get("whisper_model")
+            or os.environ.get("WHISPER_MODEL")
+            or "base"
+        )
+        # Per-upload limits for /bot; the overall request size is capped by
+        # MAX_CONTENT_LENGTH on the Flask app.
+        self.max_audio_bytes = int(
+            self.config.get("max_audio_bytes")
+            or os.environ.get("MAX_AUDIO_BYTES")
+            or 10 * 1024 * 1024
+        )
+        self.max_image_bytes = int(
+            self.config.get("max_image_bytes")
+            or os.environ.get("MAX_IMAGE_BYTES")
+            or 10 * 1024 * 1024
+        )
+        # Whole /bot request budget, and per-stage limits (seconds). A model
+        # listed in OLLAMA_MODEL_TIMEOUTS ("llava:13b=45,llama2:7b=90") uses
+        # its own limit instead of the stage default.
+        self.request_deadline = float(
+            self.config.get("request_deadline")
+            or os.environ.get("BOT_DEADLINE_SECONDS")
+            or 180
+        )
+        self.stage_timeouts = {
+            "vision": float(os.environ.get("VISION_TIMEOUT", 60)),
+            "llm": float(os.environ.get("LLM_TIMEOUT", 120)),
+            # Background jobs (job_handler) get the whole job limit per call
+            "job": float(os.environ.get("JOB_TIMEOUT", 1800)),
+        }
+        self.stage_timeouts.update(self.config.get("stage_timeouts") or {})
+        self.model_timeouts = parse_timeouts(os.environ.get("OLLAMA_MODEL_TIMEOUTS"))
+        self.model_timeouts.update(self.config.get("model_timeouts") or {})
 
-    def _run_ollama(self, model: str, messages) -> dict:
+    def timeout_for(self, model: Optional[str], stage: str) -> float:
+        if stage == "job":
+            # Per-model limits are for interactive requests
+            return self.stage_timeouts[stage]
+        return self.model_timeouts.get(model, self.stage_timeouts[stage])
+
+    def complete(self, model: str, messages) -> str:
+        """Run one non-streaming chat completion; errors are raised, not swallowed."""
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
+        client = ollama.Client(timeout=self.timeout_for(model, "llm"))
+        response = client.chat(model=model, messages=messages)
+        return response["message"]["content"]
+
+    def _run_ollama(self, model: str, messages) -> dict:
         try:
-            response = ollama.chat(model=model, messages=messages)
-            return {"text": response["message"]["content"]}
+            return {"text": self.complete(model, messages)}
         except Exception as e:
             return {"text": f"(Ollama error: {e})"}
 
+    def _iter_stream(self, method: str, model: str, deadline: Deadline, stage: str, **kwargs):
+        """
+        Yield chunks of a streaming Ollama call, checking `deadline` between
+        chunks. Raises Cancelled/DeadlineExceeded; closing the stream drops
+        the HTTP connection, which makes Ollama stop generating.
+        """
+        timeout = deadline.stage_timeout(self.timeout_for(model, stage))
+        if timeout <= 0:
+            raise DeadlineExceeded(f"{stage}: request deadline exceeded")
+        stage_end = time.monotonic() + timeout
+        client = ollama.Client(timeout=timeout)
+        try:
+            stream = getattr(client, method)(model=model, stream=True, **kwargs)
+            try:
+                for chunk in stream:
+                    yield chunk
+                    deadline.check(stage)
+                    if time.monotonic() > stage_end:
+                        raise DeadlineExceeded(f"{stage}: {model} timed out after {timeout:.0f}s")
+            finally:
+                stream.close()
+        except httpx.TimeoutException as e:
+            raise DeadlineExceeded(f"{stage}: {model} timed out after {timeout:.0f}s") from e
+
+    def _stream_chat(self, model: str, messages, deadline: Deadline, stage: str) -> str:
+        chunks = self._iter_stream("chat", model, deadline, stage, messages=messages)
+        return "".join(chunk["message"]["content"] for chunk in chunks)
+
+    def _stream_generate(self, model: str, prompt: str, deadline: Deadline, stage: str,
+                         system: Optional[str] = None, context=None):
+        """Like _stream_chat for the generate API; returns (text, context)."""
+        parts, new_context = [], None
+        for chunk in self._iter_stream("generate", model, deadline, stage,
+                                       prompt=prompt, system=system, context=context):
+            parts.append(chunk["response"])
+            if chunk.get("done"):
+                new_context = chunk.get("context")
+        return "".join(parts), new_context
+
+    def _context_reply(self, user_id: str, model: str, history, turn_text: str,
+                       deadline: Deadline, pending: dict) -> str:
+        """
+        Generate a reply reusing the stored Ollama context when it still
+        matches (same model, no events since), else replay the full history.
+        The new context is left in `pending` for the caller to store once the
+        reply has been logged.
+        """
+        last_event_id = history[-1][0] if history else None
+        state = context_cache.cache.lookup(user_id, model, last_event_id, self.context_max_tokens)
+        if state is not None:
+            text, new_context = self._stream_generate(model, turn_text, deadline, "llm", context=state.context)
+            logging.info("context reuse hit for %s (%d tokens)", user_id, len(state.context))
+        else:
+            transcript = [
+                f"{'User' if event_type == 'chat_user' else 'Assistant'}: {content}"
+                for _, event_type, content in history
+                if event_type in ("chat_user", "chat_llm")
+            ]
+            prompt = "\n\n".join(transcript + [turn_text]) if transcript else turn_text
+            text, new_context = self._stream_generate(model, prompt, deadline, "llm", system=SYSTEM_PROMPT)
+        pending["model"] = model
+        pending["context"] = new_context
+        return text
+
+    def _run_stage(self, stage: str, deadline: Deadline, fn, *args):
+        """Run one pipeline stage, recording its duration or abort in the metrics."""
+        start = time.monotonic()
+        try:
+            deadline.check(stage)
+            result = fn(*args)
+        except (Cancelled, DeadlineExceeded) as e:
+            metrics.stage_aborted(stage, time.monotonic() - start, isinstance(e, DeadlineExceeded))
+            raise
+        metrics.stage_completed(stage, time.monotonic() - start)
+        return result
+
+    def _get_whisper_model(self):
+        with _whisper_lock:
+            model = _whisper_models.get(self.whisper_model)
+            if model is None:
+                import whisper
+                model = whisper.load_model(self.whisper_model)
+                _whisper_models[self.whisper_model] = model
+            return model
+
+    def preload_models(self) -> None:
+        """Ask the Ollama server to load every model /bot may use into memory.
+
+        Only talks to the Ollama server over HTTP, so it is safe to call in a
+        server master process before workers are forked.
+        """
+        models = [self.default_chat_model, self.default_reason_model, self.vision_model]
+        if self.routing_enabled:
+            models.append(self.small_chat_model)
+        # Tiers may share a model; load each once
+        for model in dict.fromkeys(models):
+            try:
+                ollama.generate(model=model, prompt="", keep_alive="30m")
+            except Exception as e:
+                logging.warning("Could not preload model %s: %s", model, e)
+
+    def warmup(self) -> None:
+        """Load in-process models (Whisper). Call once per worker process."""
+        try:
+            self._get_whisper_model()
+        except Exception as e:
+            logging.warning("Could not load Whisper model %s: %s", self.whisper_model, e)
+
     def status(self) -> dict:
         return {
             "default_model": self.default_chat_model,
             "default_reason_model": self.default_reason_model,
+            "vision_model": self.vision_model,
+            "small_chat_model": self.small_chat_model,
+            "routing": self.routing_enabled,
+            "cascade": self.cascade_enabled,
+            "context_reuse": self.context_reuse,
+            "job_handoff": self.job_handoff,
         }
 
     def chat(self, prompt: str, model: str = None) -> dict:
@@ -42,26 +250,28 @@ class AIHandler:
         model_to_use = model or self.default_reason_model
         return self._run_ollama(model_to_use, prompt)
 
-    def caption_image(self, img_bytes: bytes) -> str:
+    def caption_image(self, img_bytes: bytes, deadline: Optional[Deadline] = None) -> str:
+        # Invalid uploads raise image_handler.ImageError for the caller to report
+        prepared = image_handler.prepare_image(img_bytes)
+        deadline = deadline or Deadline(self.timeout_for(self.vision_model, "vision"))
         try:
-            import base64
-            img_b64 = base64.b64encode(img_bytes).decode('utf-8')
             messages = [
                 {
                     "role": "user",
-                    "content": f"Describe this image in detail: data:image/jpeg;base64,{img_b64}"
+                    "content": "Describe this image in detail.",
+                    "images": [prepared],
                 }
             ]
-            response = ollama.chat(model="llava:13b", messages=messages)
-            return response["message"]["content"]
+            return self._stream_chat(self.vision_model, messages, deadline, "vision")
+        except (Cancelled, DeadlineExceeded):
+            raise
         except Exception as e:
             return f"(Image captioning failed: {e})"
 
     def transcribe_audio(self, audio_bytes: bytes) -> str:
         try:
             import tempfile
-            import whisper
-            model = whisper.load_model("base")
+            model = self._get_whisper_model()
             
             with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
                 temp_file.write(audio_bytes)
@@ -74,55 +284,205 @@ class AIHandler:
         except Exception as e:
             return f"(Transcription failed: {e})"
 
+    def transcribe_pcm(self, samples) -> str:
+        """Transcribe 16 kHz mono float32 samples (a NumPy array) with Whisper."""
+        model = self._get_whisper_model()
+        import torch
+        result = model.transcribe(samples, fp16=torch.cuda.is_available())
+        return result["text"].strip()
+
+    def model_for_tier(self, tier: str) -> str:
+        return {
+            "small": self.small_chat_model,
+            "reasoning": self.default_reason_model,
+        }.get(tier, self.default_chat_model)
+
+    def _should_hand_off(self, form, user_message, history_len, image_file, audio_file) -> bool:
+        """True if this turn should run as a background job rather than in the request."""
+        if str(form.get("async", "")).lower() in ("1", "true", "yes"):
+            return True
+        if not self.job_handoff or not self.routing_enabled or form.get("model"):
+            return False
+        # Only signals of a long generation: most reasoning-tier turns still
+        # answer within the request, and a job adds polling latency
+        text = user_message or ""
+        return len(text) >= routing.REASONING_MIN_CHARS or "```" in text
+
+    def _routed_reply(self, generate, user_message, history_len, has_image, has_audio,
+                      deadline: Deadline, model_override: Optional[str] = None) -> str:
+        """
+        Pick a model for this turn and generate the reply with
+        `generate(model)`, escalating to the medium model if needed.
+        """
+        if model_override:
+            tier, reason = "override", "model requested by client"
+        elif not self.routing_enabled:
+            tier, reason = "medium", "routing disabled"
+        else:
+            tier, reason = routing.classify(user_message or "", history_len, has_image, has_audio)
+        model = model_override or self.model_for_tier(tier)
+
+        start = time.monotonic()
+        try:
+            reply = self._run_stage("llm", deadline, generate, model)
+        except (Cancelled, DeadlineExceeded):
+            raise
+        except Exception as e:
+            if tier != "small" or not self.cascade_enabled:
+                raise
+            logging.warning("Small model %s failed, escalating: %s", model, e)
+            reply = None
+        latency = time.monotonic() - start
+
+        escalate = tier == "small" and self.cascade_enabled and not routing.reply_ok(reply, user_message or "")
+        routing.stats.record(tier, latency, escalated=escalate)
+        logging.info("route tier=%s model=%s reason=%s latency=%.2fs escalated=%s",
+                     tier, model, reason, latency, escalate)
+        if not escalate:
+            return reply
+
+        model = self.model_for_tier("medium")
+        start = time.monotonic()
+        reply = self._run_stage("llm", deadline, generate, model)
+        routing.stats.record("medium", time.monotonic() - start)
+        return reply
+
     def handle_bot_request(self, request, user_id):
+        # The client may ask for a shorter deadline (deadline_ms), never a longer one
+        seconds = self.request_deadline
+        client_ms = request.form.get("deadline_ms", type=int)
+        if client_ms:
+            seconds = min(seconds, client_ms / 1000)
+        # Starting a new request cancels this user's previous one (a retry),
+        # in this process, in other server processes (through the
+        # bot_requests row their streams poll) and as a handed-off job
+        request_id = uuid.uuid4().hex
+        db_handler.start_bot_request(user_id, request_id)
+        deadline = in_flight.start(user_id, seconds,
+                                   poll=lambda: db_handler.bot_request_cancel_reason(user_id, request_id))
+        db_handler.cancel_jobs(user_id, "bot_reply")
+        metrics.request_started()
+        try:
+            return self._handle_bot_request(request, user_id, deadline)
+        finally:
+            in_flight.finish(user_id, deadline)
+            db_handler.finish_bot_request(user_id, request_id)
+
+    def _handle_bot_request(self, request, user_id, deadline: Deadline):
         user_message = None
+        audio_file = request.files.get('audio')
+        image_file = request.files.get('image')
+        stages = [s for s, f in (("stt", audio_file), ("vision", image_file)) if f] + ["llm"]
+        aborted = None
 
         # 1) Audio
-        audio_file = request.files.get('audio')
         transcription = None
         if audio_file:
-            audio_bytes = audio_file.read()
-            transcription = self.transcribe_audio(audio_bytes)
+            audio_bytes = audio_file.read(self.max_audio_bytes + 1)
+            if len(audio_bytes) > self.max_audio_bytes:
+                return {"error": "Ljudfilen är för stor"}
+            try:
+                # Whisper runs in-process and cannot be interrupted; the
+                # deadline is checked before it starts and after it returns.
+                transcription = self._run_stage("stt", deadline, self.transcribe_audio, audio_bytes)
+                stages.remove("stt")
+            except (Cancelled, DeadlineExceeded) as e:
+                aborted = e
 
         # 2) Image
-        image_file = request.files.get('image')
         image_caption = None
         if image_file:
-            img_bytes = image_file.read()
-            image_caption = self.caption_image(img_bytes)
+            img_bytes = image_file.read(self.max_image_bytes + 1)
+            if len(img_bytes) > self.max_image_bytes:
+                return {"error": "Bilden är för stor"}
+            try:
+                if not aborted:
+                    image_caption = self._run_stage("vision", deadline, self.caption_image, img_bytes, deadline)
+                    stages.remove("vision")
+            except image_handler.ImageError as e:
+                return {"error": f"Ogiltig bild: {e}"}
+            except (Cancelled, DeadlineExceeded) as e:
+                aborted = e
 
         # 3) Text
         if not user_message:
             user_message = request.form.get("message") or transcription
 
-        if not user_message and not image_caption:
+        if not user_message and not image_caption and not aborted:
             return {"error": "Ingen input mottagen"}
 
-        # Logga användarens input
-        logged_input = user_message or f"[image only] caption:{image_caption}"
-        db_handler.add_event(user_id, "chat_user", logged_input)
+        if isinstance(aborted, Cancelled):
+            # Superseded or the tab closed: nobody will read a reply, and the
+            # turn should not end up in the history
+            logging.info("Bot request for %s cancelled: %s", user_id, aborted)
+            metrics.stages_skipped(stages[1:])
+            return {"cancelled": True}
 
-        # Hämta tidigare konversation
-        events = db_handler.get_events(user_id, limit=20)[::-1]
-        messages = [{"role": "system", "content":"Your name is Kjell, you are a wise and friendly medieval knight, an all-knowing AI assistant who helps users with their questions."}]
-        for event_type, content, _ in events:
+        # Hämta tidigare konversation (before logging this turn, so the
+        # current message is not sent twice)
+        history = db_handler.get_chat_history(user_id)
+
+        # Användarens input loggas när svaret finns (a cancelled turn logs nothing)
+        logged_input = user_message or (f"[image only] caption:{image_caption}" if image_caption else "[timed out]")
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        for _, event_type, content in history:
             if event_type == "chat_user":
                 messages.append({"role": "user", "content": content})
             elif event_type == "chat_llm":
                 messages.append({"role": "assistant", "content": content})
 
+        turn = []
         if user_message:
-            messages.append({"role": "user", "content": user_message})
+            turn.append(user_message)
         if image_caption:
-            messages.append({"role": "user", "content": f"[Image description]: {image_caption}"})
+            turn.append(f"[Image description]: {image_caption}")
+        messages.extend({"role": "user", "content": content} for content in turn)
+
+        model_override = request.form.get('model')
+        if not aborted and self._should_hand_off(request.form, user_message, len(history), image_file, audio_file):
+            from . import job_handler
+            job_handler.start_workers(self)
+            model = model_override or self.model_for_tier("reasoning")
+            # The job logs the input together with the reply (nothing if cancelled)
+            job_id = job_handler.submit("bot_reply", {
+                "model": model, "messages": messages, "user_message": user_message,
+                "logged_input": logged_input,
+            }, user_id=user_id)
+            return {"job_id": job_id, "status": "queued"}
+
+        pending_context = {}
+        if self.context_reuse:
+            def generate(model):
+                return self._context_reply(user_id, model, history, "\n\n".join(turn), deadline, pending_context)
+        else:
+            def generate(model):
+                return self._stream_chat(model, messages, deadline, "llm")
 
-        model = request.form.get('model') or self.default_chat_model
         try:
-            response = ollama.chat(model=model, messages=messages)
-            assistant_reply = response["message"]["content"]
+            if aborted:
+                raise aborted
+            assistant_reply = self._routed_reply(
+                generate, user_message, len(history), bool(image_file), bool(audio_file),
+                deadline, model_override=model_override,
+            )
+        except Cancelled as e:
+            logging.info("Bot request for %s cancelled: %s", user_id, e)
+            return {"cancelled": True}
+        except DeadlineExceeded as e:
+            logging.info("Bot request for %s timed out: %s", user_id, e)
+            # Stages after the aborted one never ran
+            metrics.stages_skipped(stages[1:])
+            assistant_reply = f"(Fallback) You said: {user_message or '[image]'}"
+            pending_context.clear()
         except Exception as e:
             logging.exception("LLM chat failed: %s", e)
             assistant_reply = f"(Fallback) You said: {user_message or '[image]'}"
+            pending_context.clear()
 
-        db_handler.add_event(user_id, "chat_llm", assistant_reply)
+        db_handler.add_event(user_id, "chat_user", logged_input)
+        reply_event_id = db_handler.add_event(user_id, "chat_llm", assistant_reply)
+        if pending_context.get("context"):
+            context_cache.cache.store(user_id, context_cache.ContextState(
+                pending_context["model"], reply_event_id, pending_context["context"]))
         return {"reply": assistant_reply}
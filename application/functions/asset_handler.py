@@ -0,0 +1,153 @@
+# asset_handler.py
+# Content-hashed, precompressed static assets.
+#
+# At startup every file under application/static/ and application/img/ is
+# hashed and, for text types, compressed with gzip (and brotli when the
+# `brotli` package is installed). Templates link assets as
+# /assets/<hash>/<path> via asset_url(); those URLs change whenever the file
+# changes, so they are served with a one-year immutable Cache-Control and
+# browsers make no asset requests on repeat visits.
+#
+# Logical paths are relative to static/ ("css/index_style.css") except for
+# images, which keep their /img/ prefix ("img/kjellOne.png").
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSET_ROOTS = {
+    "": os.path.join(APP_DIR, "static"),
+    "img": os.path.join(APP_DIR, "img"),
+}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".ico"}
+# Skip compressing tiny files; the headers cost more than they save
+MIN_COMPRESS_BYTES = 256
+DIGEST_LENGTH = 12
+
+
+@dataclass
+class Asset:
+    path: str
+    digest: str
+    mimetype: str
+    mtime: float
+    # encoding ("identity", "gzip", "br") -> body
+    bodies: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def url(self) -> str:
+        return f"/assets/{self.digest}/{self.path}"
+
+
+def load_asset(path: str, filename: str) -> Asset:
+    with open(filename, "rb") as f:
+        data = f.read()
+    ext = os.path.splitext(filename)[1].lower()
+    asset = Asset(
+        path=path,
+        digest=hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH],
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        mtime=os.path.getmtime(filename),
+        bodies={"identity": data},
+    )
+    if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+        # mtime=0 keeps the gzip output (and so the ETag's body) reproducible
+        compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(data, quality=11)
+        for encoding, body in compressed.items():
+            if len(body) < len(data):
+                asset.bodies[encoding] = body
+    return asset
+
+
+class AssetManifest:
+    def __init__(self, roots: Dict[str, str] = None, auto_reload: bool = False) -> None:
+        self.roots = roots if roots is not None else ASSET_ROOTS
+        # Re-stat files on lookup so edits show up without a restart (development)
+        self.auto_reload = auto_reload
+        self._assets: Dict[str, Asset] = {}
+        self._built = False
+        self._lock = threading.Lock()
+
+    def build(self) -> None:
+        assets = {}
+        for prefix, root in self.roots.items():
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    filename = os.path.join(dirpath, name)
+                    rel = os.path.relpath(filename, root).replace(os.sep, "/")
+                    path = f"{prefix}/{rel}" if prefix else rel
+                    assets[path] = load_asset(path, filename)
+        with self._lock:
+            self._assets = assets
+            self._built = True
+        raw = sum(len(a.bodies["identity"]) for a in assets.values())
+        logging.info("Asset manifest: %d files, %d bytes, brotli=%s", len(assets), raw, brotli is not None)
+
+    def _filename(self, path: str) -> Optional[str]:
+        prefix, _, rest = path.partition("/")
+        if prefix and prefix in self.roots:
+            return os.path.join(self.roots[prefix], rest)
+        return os.path.join(self.roots[""], path) if "" in self.roots else None
+
+    def get(self, path: str) -> Optional[Asset]:
+        if not self._built:
+            self.build()
+        with self._lock:
+            asset = self._assets.get(path)
+        if self.auto_reload and asset is not None:
+            filename = self._filename(path)
+            try:
+                if os.path.getmtime(filename) != asset.mtime:
+                    asset = load_asset(path, filename)
+                    with self._lock:
+                        self._assets[path] = asset
+            except OSError:
+                return None
+        return asset
+
+    def url_for(self, path: str) -> str:
+        """Hashed URL for an asset; unknown paths fall back to the unversioned URL."""
+        asset = self.get(path)
+        if asset is not None:
+            return asset.url
+        prefix = path.partition("/")[0]
+        return f"/{path}" if prefix and prefix in self.roots else f"/static/{path}"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            assets = list(self._assets.values())
+        return {
+            "files": len(assets),
+            "bytes": sum(len(a.bodies["identity"]) for a in assets),
+            "compressed": {
+                encoding: sum(1 for a in assets if encoding in a.bodies) for encoding in ("gzip", "br")
+            },
+        }
+
+
+def choose_encoding(asset: Asset, accept_encodings) -> str:
+    """Best precompressed body the client accepts (`accept_encodings` is request.accept_encodings)."""
+    for encoding in ("br", "gzip"):
+        if encoding in asset.bodies and accept_encodings[encoding]:
+            return encoding
+    return "identity"
+
+
+manifest = AssetManifest(auto_reload=os.environ.get("FLASK_DEBUG", "0") in ("1", "true", "True"))
+
+
+def asset_url(path: str) -> str:
+    return manifest.url_for(path)
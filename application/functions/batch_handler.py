@@ -0,0 +1,267 @@
+# batch_handler.py
+# Batch inference for offline evaluation: NDJSON prompts in, NDJSON results out.
+#
+# Input, one JSON object per line:
+#   {"id": "q1", "prompt": "...", "mode": "chat" | "reason" | "call_ll", "model": "optional"}
+# Output, one line per item, then a final {"stats": {...}} line:
+#   {"id": "q1", "index": 0, "mode": "chat", "model": "...", "ok": true, "text": "...", "seconds": 1.2}
+#   {"id": "q2", "index": 1, ..., "ok": false, "error": "..."}
+#
+# Items run on a bounded thread pool, with a separate concurrency limit per
+# model so a slow model cannot take every worker. Items wait in a queue per
+# model and are only handed to the pool when their model has a free slot, so
+# no worker sits blocked behind a busy model while another model is idle.
+#
+# Usage:
+#   python -m application.functions.batch_handler prompts.ndjson -o results.ndjson --workers 8
+#   python -m application.functions.batch_handler prompts.ndjson -o results.ndjson --resume
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Optional, Set
+
+from . import chatbot
+
+MODES = ("chat", "reason", "call_ll")
+DEFAULT_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+DEFAULT_PER_MODEL = int(os.environ.get("BATCH_PER_MODEL", "2"))
+
+
+def parse_ndjson(lines: Iterable, offset: int = 0) -> Iterator[dict]:
+    """
+    Parse NDJSON lines (str or bytes); malformed lines become error items.
+    Items without an "id" get their line number (counting from `offset`).
+    """
+    for line_no, line in enumerate(lines, start=offset):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("not a JSON object")
+        except ValueError as e:
+            item = {"_error": f"invalid JSON: {e}"}
+        item.setdefault("id", line_no)
+        yield item
+
+
+def model_for(handler, item: dict) -> str:
+    mode = item.get("mode") or "chat"
+    if item.get("model"):
+        return item["model"]
+    if mode == "reason":
+        return handler.default_reason_model
+    if mode == "call_ll":
+        return chatbot.MODEL
+    return handler.default_chat_model
+
+
+class BatchStats:
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.ok = 0
+        self.errors = 0
+        self.skipped = 0
+        self.model_seconds = 0.0
+        self.per_model = {}
+
+    def record(self, result: dict) -> None:
+        if result["ok"]:
+            self.ok += 1
+        else:
+            self.errors += 1
+        self.model_seconds += result.get("seconds", 0.0)
+        model = result.get("model")
+        if model:
+            self.per_model[model] = self.per_model.get(model, 0) + 1
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self.started_at
+        done = self.ok + self.errors
+        return {
+            "items": done,
+            "ok": self.ok,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "items_per_second": round(done / elapsed, 3) if elapsed else 0.0,
+            "avg_item_seconds": round(self.model_seconds / done, 3) if done else 0.0,
+            "per_model": dict(self.per_model),
+        }
+
+
+def run_batch(handler, items: Iterable[dict], workers: int = DEFAULT_WORKERS,
+              per_model: int = DEFAULT_PER_MODEL, ordered: bool = True,
+              skip_ids: Optional[Set[str]] = None, stats: Optional[BatchStats] = None) -> Iterator[dict]:
+    """
+    Run every item through `handler` and yield result dicts, in input order
+    (`ordered=True`) or as they complete. Items whose id is in `skip_ids`
+    are not run (resume). At most `workers * 2` items are queued, in flight
+    or waiting to be yielded, so `items` can be an arbitrarily long stream.
+    """
+    skip_ids = skip_ids or set()
+    stats = stats or BatchStats()
+    # Only touched from this generator's thread, so no locking needed
+    limits = {}
+    waiting = {}  # model -> deque of (seq, item) not yet submitted
+    future_models = {}
+
+    def invalid(item) -> Optional[str]:
+        if "_error" in item:
+            return item["_error"]
+        mode = item.get("mode") or "chat"
+        if mode not in MODES:
+            return f"unknown mode {mode!r}"
+        if not isinstance(item.get("prompt"), str) or not item["prompt"]:
+            return "missing prompt"
+        return None
+
+    def run_one(seq, item, model):
+        result = {"id": item["id"], "index": seq, "mode": item.get("mode") or "chat"}
+        error = invalid(item)
+        if error:
+            return {**result, "ok": False, "error": error}
+        result["model"] = model
+        start = time.monotonic()
+        try:
+            text = handler.complete(model, item["prompt"])
+        except Exception as e:
+            return {**result, "ok": False, "error": str(e), "seconds": round(time.monotonic() - start, 3)}
+        return {**result, "ok": True, "text": text, "seconds": round(time.monotonic() - start, 3)}
+
+    def numbered():
+        seq = 0
+        for item in items:
+            if str(item.get("id")) in skip_ids:
+                stats.skipped += 1
+                continue
+            yield seq, item
+            seq += 1
+
+    source = numbered()
+    pending = set()
+    buffer = {}
+    next_seq = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        def dispatch(model):
+            # Submit the model's queued items while it has free slots
+            queue = waiting[model]
+            while queue and limits[model].acquire(blocking=False):
+                seq, item = queue.popleft()
+                future = executor.submit(run_one, seq, item, model)
+                future_models[future] = model
+                pending.add(future)
+
+        def fill():
+            # Queued and finished-but-unyielded items count too, so one slow
+            # model cannot make the queues or the reorder buffer grow without bound
+            while len(pending) + len(buffer) + sum(map(len, waiting.values())) < workers * 2:
+                try:
+                    seq, item = next(source)
+                except StopIteration:
+                    return
+                if invalid(item):
+                    pending.add(executor.submit(run_one, seq, item, None))
+                    continue
+                model = model_for(handler, item)
+                if model not in limits:
+                    limits[model] = threading.Semaphore(max(1, per_model))
+                    waiting[model] = deque()
+                waiting[model].append((seq, item))
+                dispatch(model)
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                model = future_models.pop(future, None)
+                if model is not None:
+                    limits[model].release()
+                    dispatch(model)
+                result = future.result()
+                stats.record(result)
+                if ordered:
+                    buffer[result["index"]] = result
+                else:
+                    yield result
+            if ordered:
+                while next_seq in buffer:
+                    yield buffer.pop(next_seq)
+                    next_seq += 1
+            fill()
+
+
+def iter_result_lines(handler, items: Iterable[dict], **kwargs) -> Iterator[str]:
+    """run_batch as NDJSON lines, ending with a {"stats": ...} line."""
+    stats = BatchStats()
+    for result in run_batch(handler, items, stats=stats, **kwargs):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+    yield json.dumps({"stats": stats.snapshot()}) + "\n"
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of successful results in an existing output file (for --resume)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # partially written last line
+            if result.get("ok"):
+                done.add(str(result["id"]))
+    return done
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run NDJSON prompts through the configured models.")
+    parser.add_argument("input", help="NDJSON prompts file ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="NDJSON results file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--per-model", type=int, default=DEFAULT_PER_MODEL)
+    parser.add_argument("--order", choices=("input", "completion"), default="input")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip ids already answered in the output file and append to it")
+    args = parser.parse_args(argv)
+
+    from .AI_handler import AIHandler
+    handler = AIHandler()
+
+    skip_ids = completed_ids(args.output) if args.resume and args.output else set()
+    infile = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    if args.output:
+        outfile = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    else:
+        outfile = sys.stdout
+    stats = BatchStats()
+    try:
+        results = run_batch(handler, parse_ndjson(infile), workers=args.workers, per_model=args.per_model,
+                            ordered=args.order == "input", skip_ids=skip_ids, stats=stats)
+        for result in results:
+            outfile.write(json.dumps(result, ensure_ascii=False) + "\n")
+            outfile.flush()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    print(json.dumps({"stats": stats.snapshot()}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import ollama
 import logging
 #testings"
+MODEL = "llama2:7b"
+
 def call_ll(query: str) -> str:
     try:
         resp = ollama.chat(
-            model="llama2:7b",
+            model=MODEL,
             messages=[{"role": "user", "content": query}]
         )
         return resp["message"]["content"]
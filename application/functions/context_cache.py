@@ -0,0 +1,70 @@
+# context_cache.py
+# Per-user Ollama context state for prefix reuse across chat turns.
+#
+# After a turn generated with Ollama's generate API, the returned `context`
+# (the token state of the whole conversation so far) is stored together with
+# the model and the id of the last event it covers. On the next turn, if the
+# model is the same and no event was added or removed in between, only the
+# new user message is sent with that context, so the model does not prefill
+# the system prompt and history again. Anything else falls back to a full
+# replay of the history.
+#
+# State lives in process memory; a miss (other worker, restart) just means a
+# full replay.
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class ContextState:
+    model: str
+    last_event_id: int
+    context: List[int]
+
+
+class ContextCache:
+    def __init__(self, max_users: int = 1000) -> None:
+        self.max_users = max_users
+        self._states: "OrderedDict[str, ContextState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id: str, model: str, last_event_id: Optional[int],
+               max_tokens: int) -> Optional[ContextState]:
+        """Return the stored state if it can continue this conversation, else None."""
+        with self._lock:
+            state = self._states.get(user_id)
+            usable = (
+                state is not None
+                and state.model == model
+                and state.last_event_id == last_event_id
+                and len(state.context) <= max_tokens
+            )
+            if usable:
+                self._states.move_to_end(user_id)
+                self.hits += 1
+                return state
+            self.misses += 1
+            return None
+
+    def store(self, user_id: str, state: ContextState) -> None:
+        with self._lock:
+            self._states[user_id] = state
+            self._states.move_to_end(user_id)
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+
+    def drop(self, user_id: str) -> None:
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"users": len(self._states), "hits": self.hits, "misses": self.misses}
+
+
+cache = ContextCache()
@@ -1,7 +1,9 @@
 # db_handler.py
 # Handles database requests and responses for cookies, user IDs, and behavior logging
 
+import json
 import sqlite3 as sql
+import time
 
 DB_NAME = "database.db"
 
@@ -9,7 +11,7 @@ DB_NAME = "database.db"
 # Database Initialization
 # -----------------------------
 def init_db():
-    """Initialize the database with users and events tables."""
+    """Initialize the database with users, events and jobs tables."""
     conn = sql.connect(DB_NAME)
     print("Database initialized")
 
@@ -31,6 +33,38 @@ def init_db():
         )
     ''')
 
+    # Background jobs; times are unix epoch seconds
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            job_type TEXT,
+            status TEXT DEFAULT 'queued',
+            payload TEXT,
+            result TEXT,
+            error TEXT,
+            progress REAL DEFAULT 0,
+            message TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            expires_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, job_type, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, status)')
+
+    # The in-flight /bot request per user, shared by all server processes so
+    # a retry or /bot/cancel reaches it whichever process runs it
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_requests (
+            user_id TEXT PRIMARY KEY,
+            request_id TEXT,
+            cancelled INTEGER DEFAULT 0,
+            started_at REAL
+        )
+    ''')
+
     conn.commit()
     conn.close()
 
@@ -67,14 +101,15 @@ def get_user(user_id):
 # Event Logging
 # -----------------------------
 def add_event(user_id, event_type, content):
-    """Log a user event (annotation, chat message, LLM response, etc.)."""
+    """Log a user event (annotation, chat message, LLM response, etc.). Returns its event_id."""
     conn = sql.connect(DB_NAME)
     try:
-        conn.execute(
+        cursor = conn.execute(
             'INSERT INTO events (user_id, event_type, content) VALUES (?, ?, ?)',
             (user_id, event_type, content)
         )
         conn.commit()
+        return cursor.lastrowid
     finally:
         conn.close()
 
@@ -89,6 +124,28 @@ def get_events(user_id, limit=50):
     conn.close()
     return rows
 
+def get_chat_history(user_id, window=20, step=10):
+    """
+    Retrieve recent events oldest first as (event_id, event_type, content).
+    The window start only moves forward in blocks of `step` events, so
+    between moves the history prefix sent to the LLM stays identical from
+    one turn to the next (and the model server can reuse its cached prefix).
+    Returns between `window` and `window + step - 1` events once the
+    history is long enough.
+    """
+    conn = sql.connect(DB_NAME)
+    try:
+        count = conn.execute('SELECT COUNT(*) FROM events WHERE user_id = ?', (user_id,)).fetchone()[0]
+        start = max(0, (count - window) // step * step)
+        rows = conn.execute(
+            'SELECT event_id, event_type, content FROM events WHERE user_id = ? '
+            'ORDER BY event_id LIMIT -1 OFFSET ?',
+            (user_id, start)
+        ).fetchall()
+    finally:
+        conn.close()
+    return rows
+
 # -----------------------------
 # Memory Prompt Builder
 # -----------------------------
@@ -132,3 +189,322 @@ def clear_events(user_id):
         conn.commit()
     finally:
         conn.close()
+
+
+# -----------------------------
+# Bulk Export / Import
+# -----------------------------
+def iter_all_events(after_event_id=0, batch_size=1000):
+    """
+    Yield every event as (event_id, user_id, event_type, content, timestamp),
+    ordered by event_id, starting after `after_event_id`.
+    Uses keyset pagination on a single connection so the whole table is read
+    in one ordered pass without loading it into memory.
+    """
+    conn = sql.connect(DB_NAME)
+    try:
+        last_id = after_event_id
+        while True:
+            rows = conn.execute(
+                'SELECT event_id, user_id, event_type, content, timestamp FROM events '
+                'WHERE event_id > ? ORDER BY event_id LIMIT ?',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            yield from rows
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+class ImportConflict(ValueError):
+    """An archived event_id already exists in this database with different data."""
+
+
+EVENT_IMPORT_MODES = ("restore", "append")
+
+
+def import_users(rows):
+    """Insert (id, info) rows in one transaction; existing users are kept. Returns the number inserted."""
+    conn = sql.connect(DB_NAME)
+    try:
+        with conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO users (id, info) VALUES (?, ?)', rows)
+            return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def import_events(rows, mode="restore"):
+    """
+    Insert (event_id, user_id, event_type, content, timestamp) rows in one
+    transaction and return the number inserted.
+
+    mode="restore" keeps the archived event_ids. Rows identical to an
+    existing event are skipped, so replaying an archive is idempotent; an
+    event_id that is taken by a different event raises ImportConflict and
+    rolls back the batch.
+    mode="append" ignores the archived ids and lets SQLite assign new ones in
+    archive order, for loading an archive into a database that already has
+    its own events.
+    """
+    if mode not in EVENT_IMPORT_MODES:
+        raise ValueError(f"unknown import mode {mode!r}")
+    rows = [tuple(row) for row in rows]
+    conn = sql.connect(DB_NAME)
+    try:
+        with conn:
+            before = conn.total_changes
+            if mode == "append":
+                conn.executemany(
+                    'INSERT INTO events (user_id, event_type, content, timestamp) VALUES (?, ?, ?, ?)',
+                    [row[1:] for row in rows]
+                )
+                return conn.total_changes - before
+            conn.executemany(
+                'INSERT OR IGNORE INTO events (event_id, user_id, event_type, content, timestamp) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            inserted = conn.total_changes - before
+            if inserted < len(rows):
+                # Some ids were taken: fine if by the same event (a replay)
+                for row in rows:
+                    existing = conn.execute(
+                        'SELECT event_id, user_id, event_type, content, timestamp FROM events WHERE event_id = ?',
+                        (row[0],)
+                    ).fetchone()
+                    if existing != row:
+                        raise ImportConflict(
+                            f"event_id {row[0]} already exists with different data; "
+                            "import with mode 'append' to assign new ids"
+                        )
+            return inserted
+    finally:
+        conn.close()
+
+
+# -----------------------------
+# In-flight /bot Requests
+# -----------------------------
+def start_bot_request(user_id, request_id):
+    """Record `request_id` as the user's in-flight /bot request, superseding any previous one."""
+    conn = sql.connect(DB_NAME)
+    try:
+        conn.execute(
+            'INSERT OR REPLACE INTO bot_requests (user_id, request_id, cancelled, started_at) VALUES (?, ?, 0, ?)',
+            (user_id, request_id, time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cancel_bot_request(user_id):
+    """Mark the user's in-flight /bot request as cancelled. Returns True if there was one."""
+    conn = sql.connect(DB_NAME)
+    try:
+        cursor = conn.execute(
+            'UPDATE bot_requests SET cancelled = 1 WHERE user_id = ? AND cancelled = 0', (user_id,)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def bot_request_cancel_reason(user_id, request_id):
+    """Why `request_id` should stop (cancelled or superseded), or None if it is still current."""
+    conn = sql.connect(DB_NAME)
+    try:
+        row = conn.execute(
+            'SELECT request_id, cancelled FROM bot_requests WHERE user_id = ?', (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None or row[0] != request_id:
+        return "superseded by a newer request"
+    return "client went away" if row[1] else None
+
+
+def finish_bot_request(user_id, request_id):
+    """Forget the user's in-flight request if it is still `request_id`."""
+    conn = sql.connect(DB_NAME)
+    try:
+        conn.execute('DELETE FROM bot_requests WHERE user_id = ? AND request_id = ?', (user_id, request_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# -----------------------------
+# Job Queue
+# -----------------------------
+JOB_COLUMNS = ('job_id', 'user_id', 'job_type', 'status', 'payload', 'result', 'error',
+               'progress', 'message', 'created_at', 'started_at', 'finished_at', 'expires_at')
+
+
+def _job_dict(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ('payload', 'result'):
+        if job[key] is not None:
+            job[key] = json.loads(job[key])
+    return job
+
+
+def add_job(job_id, user_id, job_type, payload, max_active=None):
+    """
+    Queue a job; `payload` must be JSON-serialisable. With `max_active`, the
+    job is only queued if the user has fewer queued or running jobs than
+    that (checked in the same statement). Returns True if it was queued.
+    """
+    conn = sql.connect(DB_NAME)
+    try:
+        row = (job_id, user_id, job_type, 'queued', json.dumps(payload), time.time())
+        if max_active is None:
+            cursor = conn.execute(
+                'INSERT INTO jobs (job_id, user_id, job_type, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                row
+            )
+        else:
+            cursor = conn.execute(
+                'INSERT INTO jobs (job_id, user_id, job_type, status, payload, created_at) '
+                'SELECT ?, ?, ?, ?, ?, ? WHERE (SELECT COUNT(*) FROM jobs '
+                'WHERE user_id = ? AND status IN (?, ?)) < ?',
+                row + (user_id, 'queued', 'running', max_active)
+            )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def claim_job(job_type):
+    """
+    Atomically mark the oldest queued job of `job_type` as running and
+    return it as a dict, or None if there is nothing to do.
+    """
+    select = (
+        'SELECT ' + ', '.join(JOB_COLUMNS) + ' FROM jobs '
+        'WHERE status = ? AND job_type = ? ORDER BY created_at LIMIT 1'
+    )
+    conn = sql.connect(DB_NAME, isolation_level=None, timeout=30)
+    try:
+        # Idle workers poll every second: a plain read first, so an empty
+        # queue never takes the database write lock
+        if conn.execute(select, ('queued', job_type)).fetchone() is None:
+            return None
+        # IMMEDIATE takes the write lock up front so two workers (threads or
+        # processes) can never claim the same job; read again under it
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(select, ('queued', job_type)).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        now = time.time()
+        conn.execute(
+            'UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?',
+            ('running', now, row[0])
+        )
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    job = _job_dict(row)
+    job['status'] = 'running'
+    job['started_at'] = now
+    return job
+
+
+def update_job_progress(job_id, progress, message=None):
+    conn = sql.connect(DB_NAME)
+    try:
+        conn.execute(
+            'UPDATE jobs SET progress = ?, message = ? WHERE job_id = ?',
+            (progress, message, job_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def finish_job(job_id, result=None, error=None, ttl=86400):
+    """Store a job's result (or error); both are kept for `ttl` seconds. Cancelled jobs stay cancelled."""
+    now = time.time()
+    conn = sql.connect(DB_NAME)
+    try:
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, progress = ?, finished_at = ?, expires_at = ? '
+            'WHERE job_id = ? AND status != ?',
+            ('failed' if error else 'done', None if error else json.dumps(result), error,
+             1.0, now, now + ttl, job_id, 'cancelled')
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cancel_jobs(user_id, job_type, ttl=86400):
+    """Cancel a user's queued or running jobs of `job_type`. Returns the number cancelled."""
+    now = time.time()
+    conn = sql.connect(DB_NAME)
+    try:
+        cursor = conn.execute(
+            'UPDATE jobs SET status = ?, finished_at = ?, expires_at = ? '
+            'WHERE user_id = ? AND job_type = ? AND status IN (?, ?)',
+            ('cancelled', now, now + ttl, user_id, job_type, 'queued', 'running')
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def get_job_status(job_id):
+    """Just the status column, for cheap polling by running jobs."""
+    conn = sql.connect(DB_NAME)
+    try:
+        row = conn.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def get_job(job_id):
+    """Return a job as a dict, or None if it does not exist or has expired."""
+    conn = sql.connect(DB_NAME)
+    try:
+        row = conn.execute(
+            'SELECT ' + ', '.join(JOB_COLUMNS) + ' FROM jobs WHERE job_id = ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (job_id, time.time())
+        ).fetchone()
+    finally:
+        conn.close()
+    return _job_dict(row) if row else None
+
+
+def delete_expired_jobs():
+    """Remove finished jobs past their expiry time. Returns the number deleted."""
+    conn = sql.connect(DB_NAME)
+    try:
+        cursor = conn.execute('DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def requeue_stale_jobs(older_than):
+    """Put jobs that have been 'running' for more than `older_than` seconds back in the queue."""
+    conn = sql.connect(DB_NAME)
+    try:
+        cursor = conn.execute(
+            'UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?',
+            ('queued', 'running', time.time() - older_than)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
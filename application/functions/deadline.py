@@ -0,0 +1,161 @@
+# deadline.py
+# Request deadlines, cancellation and stage metrics for the /bot pipeline.
+#
+# Each /bot request gets a Deadline that is passed through every stage
+# (transcription, image captioning, LLM generation). Stages check it before
+# starting and the LLM stream checks it between chunks, so a cancelled or
+# expired request stops using the model instead of running to completion.
+# A newer /bot request from the same user (a retry) or POST /bot/cancel (sent
+# by the page when the tab closes) cancels the in-flight one. Within a process
+# that happens at once through `in_flight`; across server processes the
+# request's `poll` callback (a row in the bot_requests table) is checked at
+# most every CANCEL_POLL_SECONDS.
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CANCEL_POLL_SECONDS = 1.0
+
+
+class Cancelled(Exception):
+    """The request was cancelled by the client or superseded by a retry."""
+
+
+class DeadlineExceeded(Exception):
+    """The request or one of its stages ran out of time."""
+
+
+class Deadline:
+    def __init__(self, seconds: float, poll: Optional[Callable[[], Optional[str]]] = None) -> None:
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        self._cancelled = threading.Event()
+        self.reason = ""
+        # Returns a cancel reason if the request was cancelled elsewhere
+        self._poll = poll
+        self._polled_at = self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def stage_timeout(self, stage_limit: float) -> float:
+        """Time a stage may use: its own limit, capped by what is left overall."""
+        return min(stage_limit, self.remaining())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self.reason = reason
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self, stage: str) -> None:
+        if self._poll is not None and not self.cancelled and time.monotonic() - self._polled_at >= CANCEL_POLL_SECONDS:
+            self._polled_at = time.monotonic()
+            reason = self._poll()
+            if reason:
+                self.cancel(reason)
+        if self.cancelled:
+            raise Cancelled(f"{stage}: {self.reason}")
+        if time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(f"{stage}: request deadline exceeded")
+
+
+class InFlightRequests:
+    """Tracks the in-flight /bot request per user so it can be cancelled."""
+
+    def __init__(self) -> None:
+        self._requests: Dict[str, Deadline] = {}
+        self._lock = threading.Lock()
+
+    def start(self, user_id: str, seconds: float, poll: Optional[Callable[[], Optional[str]]] = None) -> Deadline:
+        deadline = Deadline(seconds, poll)
+        with self._lock:
+            previous = self._requests.get(user_id)
+            self._requests[user_id] = deadline
+        if previous is not None:
+            previous.cancel("superseded by a newer request")
+        return deadline
+
+    def cancel(self, user_id: str, reason: str = "client went away") -> bool:
+        with self._lock:
+            deadline = self._requests.pop(user_id, None)
+        if deadline is None:
+            return False
+        deadline.cancel(reason)
+        return True
+
+    def finish(self, user_id: str, deadline: Deadline) -> None:
+        with self._lock:
+            if self._requests.get(user_id) is deadline:
+                del self._requests[user_id]
+
+
+class StageMetrics:
+    """
+    Counters for stage outcomes plus an estimate of model time saved by
+    aborting work: for a stage cut short, the saving is its average
+    completed duration minus the time it had already run; skipped stages
+    save their whole average.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.completed: Dict[str, int] = {}
+        self.timeouts: Dict[str, int] = {}
+        self.cancellations: Dict[str, int] = {}
+        self._avg: Dict[str, float] = {}
+        self.seconds_spent_on_aborted = 0.0
+        self.seconds_saved_estimate = 0.0
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def stage_completed(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.completed[stage] = self.completed.get(stage, 0) + 1
+            # Exponential moving average of completed stage durations
+            prev = self._avg.get(stage)
+            self._avg[stage] = seconds if prev is None else 0.8 * prev + 0.2 * seconds
+
+    def stage_aborted(self, stage: str, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            counter = self.timeouts if timed_out else self.cancellations
+            counter[stage] = counter.get(stage, 0) + 1
+            self.seconds_spent_on_aborted += seconds
+            self.seconds_saved_estimate += max(0.0, self._avg.get(stage, 0.0) - seconds)
+
+    def stages_skipped(self, stages) -> None:
+        with self._lock:
+            for stage in stages:
+                self.seconds_saved_estimate += self._avg.get(stage, 0.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "completed": dict(self.completed),
+                "timeouts": dict(self.timeouts),
+                "cancellations": dict(self.cancellations),
+                "avg_stage_seconds": {k: round(v, 3) for k, v in self._avg.items()},
+                "seconds_spent_on_aborted": round(self.seconds_spent_on_aborted, 3),
+                "seconds_saved_estimate": round(self.seconds_saved_estimate, 3),
+            }
+
+
+in_flight = InFlightRequests()
+metrics = StageMetrics()
+
+
+def parse_timeouts(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "llava:13b=45,llama2:7b=90" into {"llava:13b": 45.0, ...}."""
+    timeouts = {}
+    for item in (spec or "").split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if sep and name:
+            timeouts[name] = float(value)
+    return timeouts
@@ -0,0 +1,251 @@
+# export_handler.py
+# Bulk export and import of every user and event as gzip-compressed NDJSON.
+#
+# Archive layout (directory):
+#   users.ndjson.gz          one {"type": "user", ...} record per line
+#   events-00000.ndjson.gz   {"type": "event", ...} records, ordered by event_id
+#   events-00001.ndjson.gz   ...
+#   checkpoint.json          {"last_event_id": ..., "next_shard": ..., "done": ...}
+#
+# Usage:
+#   python -m application.functions.export_handler export archive/
+#   python -m application.functions.export_handler import archive/
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from . import db_handler
+
+CHECKPOINT_FILE = "checkpoint.json"
+USERS_FILE = "users.ndjson.gz"
+SHARD_PATTERN = "events-{:05d}.ndjson.gz"
+DEFAULT_SHARD_SIZE = 50000
+DEFAULT_BATCH_SIZE = 1000
+
+
+# -----------------------------
+# Records
+# -----------------------------
+def user_record(row) -> dict:
+    user_id, info = row
+    return {"type": "user", "id": user_id, "info": info}
+
+
+def event_record(row) -> dict:
+    event_id, user_id, event_type, content, timestamp = row
+    return {
+        "type": "event",
+        "event_id": event_id,
+        "user_id": user_id,
+        "event_type": event_type,
+        "content": content,
+        "timestamp": timestamp,
+    }
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_ndjson(after_event_id: int = 0) -> Iterator[str]:
+    """Yield every user, then every event after `after_event_id`, as NDJSON lines."""
+    for row in db_handler.list_users():
+        yield _dumps(user_record(row))
+    for row in db_handler.iter_all_events(after_event_id):
+        yield _dumps(event_record(row))
+
+
+def iter_gzip(lines: Iterable[str]) -> Iterator[bytes]:
+    """Gzip-compress an iterable of text lines as a stream of byte chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for line in lines:
+        chunk = compressor.compress(line.encode("utf-8"))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+# -----------------------------
+# Export
+# -----------------------------
+def _read_checkpoint(out_dir: str) -> Optional[dict]:
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_checkpoint(out_dir: str, checkpoint: dict) -> None:
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _write_shard(path: str, records: Iterable[dict]) -> None:
+    # Write to a temp name and rename so a crash never leaves a half shard
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(_dumps(record))
+    os.replace(tmp_path, path)
+
+
+def export_archive(out_dir: str, shard_size: int = DEFAULT_SHARD_SIZE, resume: bool = True) -> dict:
+    """
+    Export the whole database into `out_dir` as sharded gzip NDJSON.
+    A checkpoint is written after every shard; with `resume=True` an
+    interrupted export continues after the last completed shard.
+    Returns the final checkpoint.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = _read_checkpoint(out_dir) if resume else None
+    if not checkpoint:
+        checkpoint = {"last_event_id": 0, "next_shard": 0, "events": 0}
+    checkpoint["done"] = False
+
+    # Users are small compared to events; always rewrite them in full
+    _write_shard(os.path.join(out_dir, USERS_FILE), (user_record(r) for r in db_handler.list_users()))
+
+    buffer = []
+
+    def flush():
+        path = os.path.join(out_dir, SHARD_PATTERN.format(checkpoint["next_shard"]))
+        _write_shard(path, buffer)
+        checkpoint["last_event_id"] = buffer[-1]["event_id"]
+        checkpoint["next_shard"] += 1
+        checkpoint["events"] += len(buffer)
+        _write_checkpoint(out_dir, checkpoint)
+        buffer.clear()
+
+    for row in db_handler.iter_all_events(checkpoint["last_event_id"]):
+        buffer.append(event_record(row))
+        if len(buffer) >= shard_size:
+            flush()
+    if buffer:
+        flush()
+
+    checkpoint["done"] = True
+    _write_checkpoint(out_dir, checkpoint)
+    return checkpoint
+
+
+# -----------------------------
+# Import
+# -----------------------------
+def _iter_records(path: str) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_records(records: Iterable[dict], batch_size: int = DEFAULT_BATCH_SIZE, mode: str = "restore") -> dict:
+    """
+    Load user/event records into the database, committing one transaction
+    per `batch_size` records. Returns counts of rows actually inserted.
+
+    mode is passed to db_handler.import_events: "restore" keeps the archived
+    event ids and raises db_handler.ImportConflict if one is taken by a
+    different event (batches already committed stay in place); "append" lets
+    SQLite assign new ids in archive order.
+    """
+    if mode not in db_handler.EVENT_IMPORT_MODES:
+        raise ValueError(f"unknown import mode {mode!r}")
+    counts = {"users": 0, "events": 0}
+    users, events = [], []
+    for record in records:
+        if record.get("type") == "user":
+            users.append((record["id"], record.get("info") or ""))
+        elif record.get("type") == "event":
+            # Make sure users exist before their events reference them
+            if users:
+                counts["users"] += db_handler.import_users(users)
+                users = []
+            events.append((
+                record["event_id"],
+                record["user_id"],
+                record["event_type"],
+                record["content"],
+                record["timestamp"],
+            ))
+        if len(users) >= batch_size:
+            counts["users"] += db_handler.import_users(users)
+            users = []
+        if len(events) >= batch_size:
+            counts["events"] += db_handler.import_events(events, mode=mode)
+            events = []
+    if users:
+        counts["users"] += db_handler.import_users(users)
+    if events:
+        counts["events"] += db_handler.import_events(events, mode=mode)
+    return counts
+
+
+def import_archive(path: str, batch_size: int = DEFAULT_BATCH_SIZE, mode: str = "restore") -> dict:
+    """
+    Import an archive directory written by `export_archive`, or a single
+    .ndjson.gz stream as returned by /admin/export_all. See `load_records`
+    for `mode`.
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, USERS_FILE)]
+        files += sorted(glob.glob(os.path.join(path, "events-*.ndjson.gz")))
+    else:
+        files = [path]
+
+    totals = {"users": 0, "events": 0}
+    for file_path in files:
+        if not os.path.exists(file_path):
+            continue
+        counts = load_records(_iter_records(file_path), batch_size=batch_size, mode=mode)
+        totals["users"] += counts["users"]
+        totals["events"] += counts["events"]
+    return totals
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk export/import of the chatbot database.")
+    parser.add_argument("--db", help="Path to the SQLite database (default: db_handler.DB_NAME)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Export every user and event into an archive directory")
+    p_export.add_argument("out_dir")
+    p_export.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    p_export.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+
+    p_import = sub.add_parser("import", help="Load an archive directory or .ndjson.gz file")
+    p_import.add_argument("path")
+    p_import.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    p_import.add_argument("--mode", choices=db_handler.EVENT_IMPORT_MODES, default="restore",
+                          help="restore: keep event ids, fail on conflicts; append: assign new ids")
+
+    args = parser.parse_args(argv)
+    if args.db:
+        db_handler.DB_NAME = args.db
+    db_handler.init_db()
+
+    if args.command == "export":
+        result = export_archive(args.out_dir, shard_size=args.shard_size, resume=not args.restart)
+    else:
+        try:
+            result = import_archive(args.path, batch_size=args.batch_size, mode=args.mode)
+        except db_handler.ImportConflict as e:
+            sys.exit(f"import failed: {e}")
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# image_handler.py
+# Validates uploaded images and shrinks them to what the vision model can use
+# before they are sent to Ollama.
+
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# llava's vision encoder works on 336px tiles (up to 672px with tiling), so
+# larger images only cost upload/encode time without adding detail.
+DEFAULT_MAX_SIDE = int(os.environ.get("VISION_MAX_SIDE", "672"))
+# Refuse decompression bombs before decoding any pixel data
+DEFAULT_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(40_000_000)))
+JPEG_QUALITY = 85
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "BMP", "MPO"}
+
+
+class ImageError(ValueError):
+    """Raised when an upload is not a usable image."""
+
+
+def prepare_image(img_bytes: bytes, max_side: int = DEFAULT_MAX_SIDE,
+                  max_pixels: int = DEFAULT_MAX_PIXELS) -> bytes:
+    """
+    Validate an uploaded image and re-encode it as a JPEG no larger than
+    `max_side` on its longest edge. EXIF/ICC metadata is dropped and the
+    EXIF orientation is applied to the pixels first.
+    """
+    if not img_bytes:
+        raise ImageError("empty upload")
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageError(f"not an image: {e}") from e
+    except Image.DecompressionBombError as e:
+        # Raised by Pillow for headers claiming far more pixels than it allows
+        raise ImageError(f"image too large: {e}") from e
+
+    if img.format not in ALLOWED_FORMATS:
+        raise ImageError(f"unsupported image format {img.format}")
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageError(f"image too large ({width}x{height})")
+
+    try:
+        # For JPEGs let the decoder downscale by a power of two while decoding
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        out = io.BytesIO()
+        # No exif/icc_profile arguments: metadata is stripped
+        img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageError(f"could not decode image: {e}") from e
+
+    result = out.getvalue()
+    logging.info(
+        "Image prepared: %d -> %d bytes, %dx%d -> %dx%d",
+        len(img_bytes), len(result), width, height, img.size[0], img.size[1],
+    )
+    return result
@@ -0,0 +1,241 @@
+# job_handler.py
+# Background jobs for long-running AI work (long reasoning prompts, large
+# transcriptions, handed-off chat replies), queued in the SQLite jobs table.
+#
+# Each job type has its own concurrency limit; a pool of worker threads per
+# process claims queued jobs, reports progress and stores the result, which
+# is kept for JOB_RESULT_TTL seconds. With several server processes the
+# limits apply per process.
+#
+# Jobs are cancelled through the jobs table (status 'cancelled'), so a
+# cancel from any process reaches them; running jobs notice within
+# CANCEL_POLL_SECONDS and close their model stream.
+
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from . import db_handler
+from .deadline import Deadline, Cancelled, DeadlineExceeded
+
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", str(24 * 3600)))
+# Jobs 'running' for longer than this are assumed lost (worker died) and requeued
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", str(2 * 3600)))
+# Queued plus running jobs one user may have through POST /jobs
+MAX_JOBS_PER_USER = int(os.environ.get("JOBS_MAX_PER_USER", "5"))
+POLL_INTERVAL = 1.0
+CANCEL_POLL_SECONDS = 1.0
+HOUSEKEEPING_INTERVAL = 60.0
+
+
+class JobError(ValueError):
+    """Raised for invalid job submissions."""
+
+
+class JobLimitError(JobError):
+    """Raised when a user already has the maximum number of active jobs."""
+
+
+class JobContext:
+    def __init__(self, job: dict, handler) -> None:
+        self.job_id = job["job_id"]
+        self.user_id = job["user_id"]
+        self.payload = job["payload"] or {}
+        self.handler = handler
+        # Limit for the job's model calls; the "job" stage timeout (JOB_TIMEOUT)
+        self.deadline = Deadline(handler.stage_timeouts["job"]) if handler is not None else None
+        self._checked_at = time.monotonic()
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        db_handler.update_job_progress(self.job_id, fraction, message)
+
+    def check_cancelled(self) -> None:
+        """Cancel the job's deadline if the job was cancelled (checked at most every CANCEL_POLL_SECONDS)."""
+        if time.monotonic() - self._checked_at < CANCEL_POLL_SECONDS:
+            return
+        self._checked_at = time.monotonic()
+        if db_handler.get_job_status(self.job_id) == "cancelled":
+            self.deadline.cancel("job cancelled")
+
+
+JOB_TYPES: Dict[str, dict] = {}
+
+
+def register_job_type(name: str, concurrency: int = 1):
+    """Register `fn(ctx) -> result` as a job type; JOBS_<NAME>_CONCURRENCY overrides the limit."""
+    def decorator(fn: Callable[[JobContext], dict]):
+        limit = int(os.environ.get(f"JOBS_{name.upper()}_CONCURRENCY", concurrency))
+        JOB_TYPES[name] = {"run": fn, "concurrency": limit}
+        return fn
+    return decorator
+
+
+# -----------------------------
+# Job Types
+# -----------------------------
+def _generate(ctx: JobContext, model: str, messages) -> str:
+    """Stream a chat completion, reporting progress every few chunks."""
+    parts = []
+    chunks = ctx.handler._iter_stream("chat", model, ctx.deadline, "job", messages=messages)
+    for i, chunk in enumerate(chunks, start=1):
+        parts.append(chunk["message"]["content"])
+        # _iter_stream checks the deadline before the next chunk
+        ctx.check_cancelled()
+        if i % 25 == 0:
+            # Total length is unknown, so report chunks rather than a fraction
+            ctx.progress(0.5, f"generated {i} chunks")
+    return "".join(parts)
+
+
+@register_job_type("reason", concurrency=1)
+def run_reason(ctx: JobContext) -> dict:
+    prompt = ctx.payload.get("prompt")
+    if not prompt:
+        raise JobError("missing prompt")
+    model = ctx.payload.get("model") or ctx.handler.default_reason_model
+    ctx.progress(0.1, f"running {model}")
+    return {"text": _generate(ctx, model, [{"role": "user", "content": prompt}]), "model": model}
+
+
+@register_job_type("bot_reply", concurrency=2)
+def run_bot_reply(ctx: JobContext) -> dict:
+    """A /bot turn handed off by AIHandler.handle_bot_request; logs the reply like /bot does."""
+    model = ctx.payload["model"]
+    ctx.progress(0.1, f"running {model}")
+    try:
+        reply = _generate(ctx, model, ctx.payload["messages"])
+    except Cancelled:
+        raise  # like a cancelled /bot turn: nothing is logged
+    except DeadlineExceeded as e:
+        logging.info("Handed-off chat timed out: %s", e)
+        reply = f"(Fallback) You said: {ctx.payload.get('user_message') or '[image]'}"
+    except Exception as e:
+        logging.exception("Handed-off chat failed: %s", e)
+        reply = f"(Fallback) You said: {ctx.payload.get('user_message') or '[image]'}"
+    db_handler.add_event(ctx.user_id, "chat_user", ctx.payload["logged_input"])
+    db_handler.add_event(ctx.user_id, "chat_llm", reply)
+    return {"reply": reply, "model": model}
+
+
+@register_job_type("transcribe", concurrency=1)
+def run_transcribe(ctx: JobContext) -> dict:
+    path = ctx.payload.get("path")
+    if not path or not os.path.exists(path):
+        raise JobError("audio file missing")
+    try:
+        ctx.progress(0.1, "transcribing")
+        model = ctx.handler._get_whisper_model()
+        text = model.transcribe(path)["text"].strip()
+    finally:
+        os.unlink(path)
+    return {"text": text}
+
+
+# -----------------------------
+# Worker Pool
+# -----------------------------
+class JobWorkerPool:
+    def __init__(self, handler) -> None:
+        self.handler = handler
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_housekeeping = 0.0
+        self._housekeeping_lock = threading.Lock()
+
+    def start(self) -> None:
+        db_handler.requeue_stale_jobs(JOB_STALE_SECONDS)
+        for job_type, spec in JOB_TYPES.items():
+            for i in range(spec["concurrency"]):
+                thread = threading.Thread(target=self._loop, args=(job_type,),
+                                          name=f"job-{job_type}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _housekeeping(self) -> None:
+        with self._housekeeping_lock:
+            if time.monotonic() - self._last_housekeeping < HOUSEKEEPING_INTERVAL:
+                return
+            self._last_housekeeping = time.monotonic()
+        db_handler.delete_expired_jobs()
+        db_handler.requeue_stale_jobs(JOB_STALE_SECONDS)
+
+    def _loop(self, job_type: str) -> None:
+        while not self._stop.is_set():
+            try:
+                self._housekeeping()
+                job = db_handler.claim_job(job_type)
+            except Exception as e:
+                logging.exception("Job queue error: %s", e)
+                job = None
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: dict) -> None:
+        ctx = JobContext(job, self.handler)
+        try:
+            result = JOB_TYPES[job["job_type"]]["run"](ctx)
+        except Cancelled:
+            logging.info("Job %s (%s) cancelled", job["job_id"], job["job_type"])
+        except Exception as e:
+            logging.exception("Job %s (%s) failed: %s", job["job_id"], job["job_type"], e)
+            db_handler.finish_job(job["job_id"], error=str(e) or type(e).__name__, ttl=JOB_RESULT_TTL)
+        else:
+            db_handler.finish_job(job["job_id"], result=result, ttl=JOB_RESULT_TTL)
+
+
+_pool: Optional[JobWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_workers(handler=None) -> JobWorkerPool:
+    """Start this process's worker pool once; later calls return the running pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if handler is None:
+                from .AI_handler import AIHandler
+                handler = AIHandler()
+            _pool = JobWorkerPool(handler)
+            _pool.start()
+        return _pool
+
+
+def submit(job_type: str, payload: dict, user_id: Optional[str] = None,
+           max_active: Optional[int] = None) -> str:
+    """Queue a job and return its id; `max_active` caps the user's queued and running jobs."""
+    if job_type not in JOB_TYPES:
+        raise JobError(f"unknown job type {job_type!r}")
+    job_id = str(uuid.uuid4())
+    if not db_handler.add_job(job_id, user_id, job_type, payload, max_active=max_active):
+        raise JobLimitError(f"at most {max_active} queued or running jobs per user")
+    start_workers().notify()
+    return job_id
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job (no payload)."""
+    return {
+        "job_id": job["job_id"],
+        "type": job["job_type"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+    }
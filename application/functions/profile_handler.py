@@ -0,0 +1,254 @@
+# profile_handler.py
+# On-demand request profiling for admins, plus 1-in-N sampled profiling.
+#
+# Modes:
+#   "cprofile" - deterministic cProfile of the request; exact call counts but
+#                slows the request down. Saved as a pstats file (.prof).
+#   "sample"   - a background thread snapshots the request thread's stack
+#                every PROFILE_SAMPLE_INTERVAL seconds via sys._current_frames();
+#                low overhead. Saved as collapsed stacks (.folded), the input
+#                format of flamegraph.pl and speedscope.
+#
+# Each saved profile also gets a .json file with the request metadata and a
+# top-N hot-function summary. Only the newest PROFILE_KEEP profiles are kept.
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "kjell_profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+# Profile 1 in N requests with the sampler (0 = off)
+PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+TOP_N = 20
+MODES = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+
+# Only one cProfile profiler can be active per interpreter on newer Pythons,
+# so concurrent cProfile requests fall back to the sampler
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_firstlineno}({code.co_name})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """A profiler running for the duration of one request."""
+
+    def __init__(self, mode: str) -> None:
+        if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+            mode = "sample"
+        self.mode = mode
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.seconds = 0.0
+        self.stopped = False
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = StackSampler(threading.get_ident())
+            self._profiler.start()
+
+    def stop(self) -> None:
+        if self.stopped:
+            return
+        self.stopped = True
+        self.seconds = time.perf_counter() - self._start
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            _cprofile_lock.release()
+        else:
+            self._profiler.stop()
+
+    def save(self, meta: dict) -> str:
+        """Write the profile and its metadata to PROFILE_DIR; returns the profile id."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at)) + "-" + uuid.uuid4().hex[:8]
+        path = os.path.join(PROFILE_DIR, profile_id + EXTENSIONS[self.mode])
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._profiler.folded())
+        meta = {
+            **meta,
+            "id": profile_id,
+            "mode": self.mode,
+            "created_at": self.started_at,
+            "seconds": round(self.seconds, 4),
+            "top": summarize(profile_id, self.mode, TOP_N),
+        }
+        with open(os.path.join(PROFILE_DIR, profile_id + ".json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        prune()
+        return profile_id
+
+
+# -----------------------------
+# Triggers
+# -----------------------------
+_request_counter = 0
+_counter_lock = threading.Lock()
+
+
+def requested_mode(flag: Optional[str]) -> Optional[str]:
+    """Map an X-Profile header / ?_profile= value to a mode ("1" means cprofile)."""
+    flag = (flag or "").strip().lower()
+    if not flag or flag in ("0", "false", "no"):
+        return None
+    return flag if flag in MODES else "cprofile"
+
+
+def sample_this_request(rate: int = None) -> bool:
+    """True for every Nth request when sampled profiling is on."""
+    global _request_counter
+    rate = PROFILE_SAMPLE_RATE if rate is None else rate
+    if rate <= 0:
+        return False
+    with _counter_lock:
+        _request_counter += 1
+        return _request_counter % rate == 0
+
+
+# -----------------------------
+# Stored Profiles
+# -----------------------------
+def _safe_id(profile_id: str) -> bool:
+    return bool(profile_id) and all(c.isalnum() or c == "-" for c in profile_id)
+
+
+def profile_path(profile_id: str, mode: str) -> Optional[str]:
+    if not _safe_id(profile_id) or mode not in EXTENSIONS:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + EXTENSIONS[mode])
+    return path if os.path.exists(path) else None
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    if not _safe_id(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles() -> List[dict]:
+    """Metadata of stored profiles, newest first (without the summaries)."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            meta = get_profile(name[:-5])
+            if meta:
+                meta.pop("top", None)
+                profiles.append(meta)
+    return profiles
+
+
+def prune(keep: int = None) -> None:
+    keep = PROFILE_KEEP if keep is None else keep
+    ids = sorted({name.rsplit(".", 1)[0] for name in os.listdir(PROFILE_DIR)}, reverse=True)
+    for profile_id in ids[keep:]:
+        for ext in (".json", *EXTENSIONS.values()):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+            except OSError:
+                pass
+
+
+def summarize(profile_id: str, mode: str, top: int = TOP_N) -> List[dict]:
+    """Top-N functions by self time: calls, self and total seconds (or sample counts)."""
+    path = profile_path(profile_id, mode)
+    if path is None:
+        return []
+    if mode == "cprofile":
+        stats = pstats.Stats(path, stream=io.StringIO())
+        rows = []
+        for (filename, line, func), (_, calls, self_time, total_time, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({func})",
+                "calls": calls,
+                "self_seconds": round(self_time, 6),
+                "total_seconds": round(total_time, 6),
+            })
+        rows.sort(key=lambda r: r["self_seconds"], reverse=True)
+        return rows[:top]
+
+    self_samples, total_samples = Counter(), Counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if not stack:
+                continue
+            frames = stack.split(";")
+            self_samples[frames[-1]] += int(count)
+            for frame in set(frames):
+                total_samples[frame] += int(count)
+    return [
+        {"function": func, "self_samples": count, "total_samples": total_samples[func]}
+        for func, count in self_samples.most_common(top)
+    ]
+
+
+def summary_text(profile_id: str, mode: str, top: int = TOP_N) -> str:
+    """pstats-style text report for a cProfile profile."""
+    path = profile_path(profile_id, mode)
+    if path is None or mode != "cprofile":
+        return ""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("tottime").print_stats(top)
+    return out.getvalue()
+
+
+def save_quietly(profile: RequestProfile, meta: dict) -> Optional[str]:
+    """Save a profile, logging instead of failing the request on errors."""
+    try:
+        return profile.save(meta)
+    except Exception as e:
+        logging.exception("Could not save profile: %s", e)
+        return None
@@ -0,0 +1,112 @@
+# routing.py
+# Cheap heuristics that pick a model tier for each chat turn, plus the
+# quality check used to escalate weak small-model answers.
+#
+# Tiers: "small" (greetings, thanks, short chit-chat), "medium" (the default
+# chat model) and "reasoning" (maths, code, multi-step questions).
+
+import re
+import threading
+from typing import Dict, Tuple
+
+SMALL_MAX_CHARS = 40
+REASONING_MIN_CHARS = 600
+
+SMALL_TALK = re.compile(
+    r"^\s*(hi|hello|hey|hej|hallå|tja|thanks|thank you|thx|tack|ok|okay|bye|hejdå|"
+    r"good (morning|evening|night)|god (morgon|kväll|natt))\b",
+    re.IGNORECASE,
+)
+# Only words that rarely show up in casual chat: "why does", "compare" or
+# "explain" alone also start questions the medium model answers fine
+REASONING_HINTS = re.compile(
+    r"\b(prove|proof|derive|step[- ]by[- ]step|calculate|compute|equation|"
+    r"algorithm|time complexity|trade-?offs?|debug|optimi[sz]e|"
+    r"beräkna|bevisa|steg för steg|ekvation)\b",
+    re.IGNORECASE,
+)
+# Arithmetic ("12 * 34", "2+2=4"; "-" and "/" only with spaces, so "10-11" and
+# "10/11" stay dates and times) or code (fences, definitions, braces or
+# statements on their own line)
+MATH_OR_CODE = re.compile(
+    r"(\d+\s*[+*^=]\s*\d+|\d+\s+[-/]\s+\d+|```|\bdef \w+\s*\(|\bclass \w+\s*[(:]|"
+    r"^\s*[{}]\s*$|\)\s*;\s*$)",
+    re.MULTILINE,
+)
+
+WEAK_REPLY = re.compile(
+    r"(i('m| am) not sure|i don'?t know|i cannot help|as an ai\b|jag vet inte)",
+    re.IGNORECASE,
+)
+
+
+def classify(message: str, history_len: int = 0, has_image: bool = False,
+             has_audio: bool = False) -> Tuple[str, str]:
+    """Return (tier, reason) for one chat turn."""
+    text = (message or "").strip()
+    if len(text) >= REASONING_MIN_CHARS:
+        return "reasoning", "long message"
+    if REASONING_HINTS.search(text):
+        return "reasoning", "reasoning keyword"
+    if MATH_OR_CODE.search(text):
+        return "reasoning", "math or code"
+    if has_image:
+        # The image caption adds context the small model handles poorly
+        return "medium", "image attached"
+    if SMALL_TALK.match(text) and len(text) <= SMALL_MAX_CHARS * 2:
+        return "small", "small talk"
+    if len(text) <= SMALL_MAX_CHARS and not has_audio and history_len <= 10:
+        return "small", "short message"
+    return "medium", "default"
+
+
+def reply_ok(reply: str, message: str = "") -> bool:
+    """Cheap quality check for a small-model reply; False means escalate."""
+    text = (reply or "").strip()
+    if not text or text.startswith("(Fallback)"):
+        return False
+    if WEAK_REPLY.search(text):
+        return False
+    # A one- or two-word answer to a real question is usually a miss
+    if message.strip().endswith("?") and len(text.split()) < 3:
+        return False
+    return True
+
+
+class RoutingStats:
+    """
+    Per-tier counters and latency averages. "latency_saved_seconds" compares
+    each non-escalated cheaper turn with the average medium-tier latency;
+    escalations add the small model's wasted time as a negative saving.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.turns: Dict[str, int] = {}
+        self.escalations = 0
+        self._avg_latency: Dict[str, float] = {}
+        self.latency_saved_seconds = 0.0
+
+    def record(self, tier: str, latency: float, escalated: bool = False) -> None:
+        with self._lock:
+            self.turns[tier] = self.turns.get(tier, 0) + 1
+            prev = self._avg_latency.get(tier)
+            self._avg_latency[tier] = latency if prev is None else 0.8 * prev + 0.2 * latency
+            medium = self._avg_latency.get("medium")
+            if escalated:
+                self.escalations += 1
+                self.latency_saved_seconds -= latency
+            elif tier == "small" and medium is not None:
+                self.latency_saved_seconds += medium - latency
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "turns": dict(self.turns),
+                "escalations": self.escalations,
+                "avg_latency_seconds": {k: round(v, 3) for k, v in self._avg_latency.items()},
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3),
+            }
+
+
+stats = RoutingStats()
@@ -0,0 +1,227 @@
+# stt_stream.py
+# Incremental speech-to-text for audio streamed from the browser AudioWorklet.
+#
+# The client POSTs raw little-endian Float32 PCM chunks while the user is
+# speaking. Each stream buffers the audio at 16 kHz (Whisper's input rate),
+# produces partial transcripts in the background and commits finished
+# segments at quiet points, so when recording stops only the last few seconds
+# still need transcribing.
+#
+# Streams live in process memory, so every chunk of a recording must reach
+# the same process: `run.py --prod` refuses more than one worker while
+# streaming is enabled (STT_STREAMING, default on).
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+STREAMING_ENABLED = os.environ.get("STT_STREAMING", "1").lower() in ("1", "true", "yes")
+TARGET_RATE = 16000
+# Re-run the partial transcript after this much new audio
+PARTIAL_EVERY_SECONDS = 1.5
+# Commit a segment once this much audio is pending ...
+SEGMENT_SECONDS = 8.0
+# ... cutting at the quietest point within this many trailing seconds
+CUT_SEARCH_SECONDS = 2.0
+CUT_WINDOW_SECONDS = 0.1
+MAX_STREAM_SECONDS = 300.0
+STREAM_IDLE_TIMEOUT = 120.0
+# How far ahead of the next expected chunk a client may get (lost or slow requests)
+MAX_OUT_OF_ORDER = 16
+MAX_STREAMS_PER_USER = 2
+
+# Whisper is heavy; keep background transcription to a couple of threads
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stt")
+
+
+class StreamError(ValueError):
+    """Raised for malformed or out-of-bounds audio chunks."""
+
+
+def decode_pcm(data: bytes) -> np.ndarray:
+    """Decode raw little-endian Float32 PCM bytes."""
+    if len(data) % 4:
+        raise StreamError("chunk length is not a multiple of 4 bytes")
+    return np.frombuffer(data, dtype="<f4").astype(np.float32)
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int = TARGET_RATE) -> np.ndarray:
+    """
+    Resample to `dst_rate`. Integer ratios (48k/16k) are averaged in blocks,
+    which also acts as a cheap anti-aliasing filter; other ratios use
+    linear interpolation.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples.astype(np.float32)
+    ratio = src_rate / dst_rate
+    if ratio.is_integer():
+        r = int(ratio)
+        n = len(samples) // r * r
+        return samples[:n].reshape(-1, r).mean(axis=1).astype(np.float32)
+    x_new = np.arange(0, len(samples), ratio)
+    return np.interp(x_new, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def find_cut(samples: np.ndarray, rate: int = TARGET_RATE) -> int:
+    """Index of the quietest short window in the trailing part of `samples`."""
+    window = max(1, int(CUT_WINDOW_SECONDS * rate))
+    start = max(0, len(samples) - int(CUT_SEARCH_SECONDS * rate))
+    tail = samples[start:]
+    n = len(tail) // window
+    if n < 2:
+        return len(samples)
+    energy = (tail[:n * window].reshape(n, window) ** 2).mean(axis=1)
+    quietest = int(np.argmin(energy))
+    return start + quietest * window + window // 2
+
+
+class AudioStream:
+    def __init__(self, sample_rate: int, transcribe: Callable[[np.ndarray], str]) -> None:
+        self.sample_rate = sample_rate
+        self.transcribe = transcribe
+        self.lock = threading.Lock()
+        self.next_seq = 0
+        self.out_of_order: Dict[int, np.ndarray] = {}
+        # Chunks that never arrived; finish() skips over them
+        self.missing = []
+        # Raw samples left over from integer-ratio resampling
+        self.carry = np.empty(0, dtype=np.float32)
+        self.pending = np.empty(0, dtype=np.float32)
+        self.total_samples = 0
+        self.committed = []
+        self.partial = ""
+        # total_samples when `partial` covered all of `pending`, else None
+        self.partial_total: Optional[int] = None
+        self.samples_at_partial = 0
+        self.job = None
+        self.last_seen = time.monotonic()
+
+    # -- ingestion --
+    def add_chunk(self, seq: int, samples: np.ndarray) -> None:
+        with self.lock:
+            self.last_seen = time.monotonic()
+            if seq < self.next_seq or seq in self.out_of_order:
+                return  # duplicate (client retry)
+            if seq > self.next_seq + MAX_OUT_OF_ORDER:
+                raise StreamError(f"chunk {seq} is too far ahead of chunk {self.next_seq}")
+            self.out_of_order[seq] = samples
+            while self.next_seq in self.out_of_order:
+                self._append(self.out_of_order.pop(self.next_seq))
+                self.next_seq += 1
+            # Buffered chunks count too, so skipping a seq cannot bypass the limit
+            buffered = sum(len(s) for s in self.out_of_order.values()) * TARGET_RATE / self.sample_rate
+            if self.total_samples + buffered > MAX_STREAM_SECONDS * TARGET_RATE:
+                raise StreamError("recording too long")
+            self._schedule()
+
+    def _append(self, samples: np.ndarray) -> None:
+        raw = np.concatenate([self.carry, samples])
+        ratio = self.sample_rate / TARGET_RATE
+        if ratio.is_integer() and ratio > 1:
+            usable = len(raw) // int(ratio) * int(ratio)
+            self.carry = raw[usable:]
+            raw = raw[:usable]
+        else:
+            self.carry = np.empty(0, dtype=np.float32)
+        converted = resample(raw, self.sample_rate)
+        self.pending = np.concatenate([self.pending, converted])
+        self.total_samples += len(converted)
+
+    # -- background transcription --
+    def _schedule(self) -> None:
+        # Called with self.lock held
+        if self.job is not None and not self.job.done():
+            return
+        new_audio = self.total_samples - self.samples_at_partial
+        if new_audio >= PARTIAL_EVERY_SECONDS * TARGET_RATE:
+            self.job = _executor.submit(self._step)
+
+    def _step(self) -> None:
+        with self.lock:
+            audio = self.pending
+            snapshot_total = self.total_samples
+            self.samples_at_partial = snapshot_total
+        try:
+            if len(audio) >= SEGMENT_SECONDS * TARGET_RATE:
+                cut = find_cut(audio)
+                text = self.transcribe(audio[:cut])
+                with self.lock:
+                    self.committed.append(text.strip())
+                    # Audio that arrived meanwhile was appended after `audio`
+                    self.pending = self.pending[cut:]
+                    self.partial = ""
+                    self.partial_total = None
+            else:
+                text = self.transcribe(audio)
+                with self.lock:
+                    self.partial = text.strip()
+                    self.partial_total = snapshot_total
+        except Exception as e:
+            logging.exception("Streaming transcription failed: %s", e)
+
+    def text(self) -> str:
+        with self.lock:
+            return " ".join(t for t in self.committed + [self.partial] if t)
+
+    def finish(self) -> str:
+        """Wait for background work and transcribe whatever audio is left."""
+        with self.lock:
+            # Chunks after a lost one are still usable; keep them, in order
+            for seq in sorted(self.out_of_order):
+                self.missing.extend(range(self.next_seq, seq))
+                self._append(self.out_of_order.pop(seq))
+                self.next_seq = seq + 1
+            if self.missing:
+                logging.warning("Audio stream finished with missing chunks %s", self.missing)
+        job = self.job
+        if job is not None:
+            job.result()
+        with self.lock:
+            audio = self.pending
+            self.pending = np.empty(0, dtype=np.float32)
+            # The last partial already covers everything received
+            reuse_partial = self.partial_total == self.total_samples
+        if reuse_partial:
+            tail = self.partial
+        else:
+            tail = self.transcribe(audio).strip() if len(audio) else ""
+        with self.lock:
+            self.partial = ""
+            return " ".join(t for t in self.committed + [tail] if t)
+
+
+class StreamRegistry:
+    """In-memory map of (user_id, stream_id) -> AudioStream with idle expiry."""
+
+    def __init__(self) -> None:
+        self._streams: Dict[Tuple[str, str], AudioStream] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Tuple[str, str], sample_rate: int,
+                      transcribe: Callable[[np.ndarray], str]) -> AudioStream:
+        with self._lock:
+            self._expire()
+            stream = self._streams.get(key)
+            if stream is None:
+                if sum(1 for user_id, _ in self._streams if user_id == key[0]) >= MAX_STREAMS_PER_USER:
+                    raise StreamError("too many open recordings")
+                stream = AudioStream(sample_rate, transcribe)
+                self._streams[key] = stream
+            return stream
+
+    def pop(self, key: Tuple[str, str]) -> Optional[AudioStream]:
+        with self._lock:
+            return self._streams.pop(key, None)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, s in self._streams.items() if now - s.last_seen > STREAM_IDLE_TIMEOUT]:
+            del self._streams[key]
+
+
+streams = StreamRegistry()
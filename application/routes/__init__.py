@@ -2,5 +2,7 @@ from .main import main_bp
 from .auth import auth_bp
 from .admin import admin_bp
 from .api import api_bp
+from .jobs import jobs_bp
+from .assets import assets_bp
 
-__all__ = ['main_bp', 'auth_bp', 'admin_bp', 'api_bp']
\ No newline at end of file
+__all__ = ['main_bp', 'auth_bp', 'admin_bp', 'api_bp', 'jobs_bp', 'assets_bp']
\ No newline at end of file
@@ -1,7 +1,10 @@
-from flask import Blueprint, render_template, request, jsonify, make_response, send_file
-from ..functions import db_handler
+from flask import Blueprint, render_template, request, jsonify, make_response, send_file, Response, stream_with_context, g, session
+from ..functions import db_handler, export_handler, profile_handler
 import io
+import os
 import csv
+import gzip
+import json
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -75,4 +78,108 @@ def admin_clear():
     if not user_id:
         return jsonify({'ok': False, 'error': 'no user_id provided'}), 400
     db_handler.clear_events(user_id)
-    return jsonify({'ok': True})
\ No newline at end of file
+    return jsonify({'ok': True})
+
+@admin_bp.route('/admin/export_all')
+@admin_required
+def admin_export_all():
+    # stream every user and event as gzip NDJSON in one ordered pass;
+    # ?after_event_id=N resumes an interrupted download
+    after_event_id = request.args.get('after_event_id', 0, type=int)
+    body = export_handler.iter_gzip(export_handler.iter_ndjson(after_event_id))
+    resp = Response(stream_with_context(body), mimetype='application/gzip')
+    resp.headers['Content-Disposition'] = 'attachment; filename=export_all.ndjson.gz'
+    return resp
+
+@admin_bp.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import():
+    # load an uploaded .ndjson.gz archive (as produced by /admin/export_all)
+    archive = request.files.get('archive')
+    if not archive:
+        return jsonify({'ok': False, 'error': 'no archive uploaded'}), 400
+    batch_size = request.form.get('batch_size', export_handler.DEFAULT_BATCH_SIZE, type=int)
+    mode = request.form.get('mode', 'restore')
+    if mode not in db_handler.EVENT_IMPORT_MODES:
+        return jsonify({'ok': False, 'error': f'unknown mode {mode!r}'}), 400
+    try:
+        with gzip.open(archive.stream, 'rt', encoding='utf-8') as f:
+            records = (json.loads(line) for line in f if line.strip())
+            counts = export_handler.load_records(records, batch_size=batch_size, mode=mode)
+    except db_handler.ImportConflict as e:
+        return jsonify({'ok': False, 'error': str(e)}), 409
+    except (OSError, ValueError, KeyError) as e:
+        return jsonify({'ok': False, 'error': f'invalid archive: {e}'}), 400
+    return jsonify({'ok': True, **counts})
+
+
+# -----------------------------
+# Request profiling
+# -----------------------------
+@admin_bp.before_app_request
+def start_profile():
+    # Admins ask for a profile of one request with an X-Profile header or
+    # ?_profile=1 (cprofile) / ?_profile=sample; PROFILE_SAMPLE_RATE=N also
+    # samples 1 in N requests from anyone
+    if request.path.startswith('/admin/profiles') or request.path.startswith('/assets/'):
+        return
+    mode, trigger = None, 'admin'
+    if session.get('admin_logged_in'):
+        mode = profile_handler.requested_mode(request.headers.get('X-Profile') or request.args.get('_profile'))
+    if mode is None and profile_handler.sample_this_request():
+        mode, trigger = 'sample', 'sampled'
+    if mode:
+        g.profile = profile_handler.RequestProfile(mode)
+        g.profile_trigger = trigger
+
+@admin_bp.after_app_request
+def save_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        profile_id = profile_handler.save_quietly(profile, {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'trigger': g.get('profile_trigger'),
+        })
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+@admin_bp.teardown_app_request
+def stop_profile(exc):
+    # after_request is skipped when the view raised; still release the profiler
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
+@admin_bp.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """List stored profiles, newest first."""
+    return jsonify(profile_handler.list_profiles())
+
+@admin_bp.route('/admin/profiles/<profile_id>')
+@admin_required
+def admin_profile(profile_id):
+    """Profile metadata with the top-N hot functions (?top=N, ?format=text for a pstats report)."""
+    meta = profile_handler.get_profile(profile_id)
+    if meta is None:
+        return jsonify({'ok': False, 'error': 'unknown profile'}), 404
+    top = request.args.get('top', profile_handler.TOP_N, type=int)
+    if request.args.get('format') == 'text' and meta['mode'] == 'cprofile':
+        return Response(profile_handler.summary_text(profile_id, meta['mode'], top), mimetype='text/plain')
+    meta['top'] = profile_handler.summarize(profile_id, meta['mode'], top)
+    return jsonify(meta)
+
+@admin_bp.route('/admin/profiles/<profile_id>/download')
+@admin_required
+def admin_profile_download(profile_id):
+    """Download the raw profile: pstats (.prof) or collapsed stacks (.folded)."""
+    meta = profile_handler.get_profile(profile_id)
+    path = meta and profile_handler.profile_path(profile_id, meta['mode'])
+    if not path:
+        return jsonify({'ok': False, 'error': 'unknown profile'}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path),
+                     mimetype='application/octet-stream')
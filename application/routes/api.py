@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify, send_file, send_from_directory
+from flask import Blueprint, request, jsonify, send_file, send_from_directory, session, Response, stream_with_context
 from ..functions.AI_handler import AIHandler
+from ..functions import deadline, routing, context_cache, batch_handler
 import os
 import io
 import re
@@ -30,9 +31,47 @@ def ai_status():
         return jsonify({"ok": False, "error": str(e)}), 500
     return jsonify({"ok": True, "status": status})
 
+@api_bp.route('/ai/metrics')
+def ai_metrics():
+    """Return /bot stage counters (timeouts, cancellations, time saved), routing and context reuse stats."""
+    return jsonify({
+        "ok": True,
+        "metrics": deadline.metrics.snapshot(),
+        "routing": routing.stats.snapshot(),
+        "context_cache": context_cache.cache.snapshot(),
+    })
+
+@api_bp.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Run an NDJSON body of prompts and stream NDJSON results back.
+    Query params: order=input|completion, workers, per_model, start (skip the
+    first N input lines when resuming an ordered run).
+    Requires an admin session or "Authorization: Bearer $BATCH_API_TOKEN".
+    """
+    token = os.environ.get("BATCH_API_TOKEN")
+    authorized = session.get('admin_logged_in') or (
+        token and request.headers.get('Authorization') == f"Bearer {token}"
+    )
+    if not authorized:
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    workers = max(1, min(request.args.get('workers', batch_handler.DEFAULT_WORKERS, type=int), 32))
+    per_model = max(1, request.args.get('per_model', batch_handler.DEFAULT_PER_MODEL, type=int))
+    ordered = request.args.get('order', 'input') != 'completion'
+    start = request.args.get('start', 0, type=int)
+
+    # Read the whole body before streaming the response; WSGI servers do not
+    # reliably allow reading input after output has started.
+    lines = request.get_data().splitlines()[start:]
+    items = list(batch_handler.parse_ndjson(lines, offset=start))
+    body = batch_handler.iter_result_lines(ai_handler_instance, items, workers=workers,
+                                           per_model=per_model, ordered=ordered)
+    return Response(stream_with_context(body), mimetype='application/x-ndjson')
+
 @api_bp.route('/img/<path:filename>')
 def img_file(filename):
-    return send_from_directory('img', filename)
+    return send_from_directory('img', filename, max_age=86400)
 
 @api_bp.route('/tts', methods=['POST'])
 def tts():
@@ -0,0 +1,33 @@
+from flask import Blueprint, request, Response, abort
+from ..functions import asset_handler
+
+assets_bp = Blueprint('assets', __name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@assets_bp.app_context_processor
+def inject_asset_url():
+    return {"asset_url": asset_handler.asset_url}
+
+@assets_bp.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it."""
+    asset = asset_handler.manifest.get(filename)
+    if asset is None:
+        abort(404)
+    encoding = asset_handler.choose_encoding(asset, request.accept_encodings)
+    etag = asset.digest if encoding == "identity" else f"{asset.digest}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    # A page from before a deploy can still ask for the old hash: serve the
+    # current file, but do not let it be cached under the stale URL
+    response.headers["Cache-Control"] = IMMUTABLE if digest == asset.digest else "no-cache"
+    return response
@@ -1,15 +1,28 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session
+from flask import Blueprint, render_template, request, redirect, url_for, session, current_app
 from ..functions import cookie_handler
+import hmac
+import os
 
 auth_bp = Blueprint('auth', __name__)
 
-ADMIN_PASSWORD = '123'  # In production, use environment variable
+DEV_ADMIN_PASSWORD = '123'  # only accepted when the app runs in debug mode
+
+
+def admin_password():
+    """ADMIN_PASSWORD from the environment; without it admin login is disabled outside debug."""
+    password = os.environ.get("ADMIN_PASSWORD")
+    if not password and current_app.debug:
+        return DEV_ADMIN_PASSWORD
+    return password
 
 @auth_bp.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
-        password = request.form.get('password')
-        if password == ADMIN_PASSWORD:
+        password = request.form.get('password') or ''
+        expected = admin_password()
+        if not expected:
+            return render_template('admin_login.html', error='Admin login is disabled (ADMIN_PASSWORD is not set)')
+        if hmac.compare_digest(password.encode(), expected.encode()):
             session['admin_logged_in'] = True
             return redirect(url_for('admin.admin_panel'))
         else:
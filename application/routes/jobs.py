@@ -0,0 +1,108 @@
+from flask import Blueprint, request, jsonify, session
+from ..functions import db_handler, job_handler
+import os
+import tempfile
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_FILES_DIR = os.environ.get("JOB_FILES_DIR") or os.path.join(tempfile.gettempdir(), "kjell_jobs")
+MAX_JOB_AUDIO_BYTES = int(os.environ.get("MAX_JOB_AUDIO_MB", "200")) * 1024 * 1024
+# Room for the multipart framing and form fields around the audio file
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+@jobs_bp.before_request
+def allow_large_audio_uploads():
+    # The app-wide MAX_CONTENT_LENGTH is sized for /bot; audio for
+    # transcribe jobs may be larger. Werkzeug enforces the limit while it
+    # reads the body, so oversized uploads still get a 413 early.
+    if request.endpoint == 'jobs.submit_job' and request.mimetype == 'multipart/form-data':
+        request.max_content_length = MAX_JOB_AUDIO_BYTES + UPLOAD_OVERHEAD_BYTES
+
+
+def _save_upload(upload, fd, limit):
+    """Copy an uploaded file to `fd` in chunks; False as soon as it exceeds `limit` bytes."""
+    size = 0
+    with os.fdopen(fd, "wb") as f:
+        while True:
+            chunk = upload.stream.read(COPY_CHUNK_BYTES)
+            if not chunk:
+                return True
+            size += len(chunk)
+            if size > limit:
+                return False
+            f.write(chunk)
+
+
+def _visible_job(job_id):
+    """The job if the current user (or an admin) may see it, else None."""
+    job = db_handler.get_job(job_id)
+    if job is None:
+        return None
+    if session.get('admin_logged_in') or (job["user_id"] and job["user_id"] == request.cookies.get("user_id")):
+        return job
+    return None
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a background job. JSON {"type": "reason", "payload": {"prompt": ...}},
+    or multipart with type=transcribe and an 'audio' file.
+    """
+    user_id = request.cookies.get("user_id")
+    if not user_id:
+        return jsonify({"error": "no user_id"}), 401
+
+    audio_path = None
+    if request.files.get('audio'):
+        job_type = request.form.get('type', 'transcribe')
+        if job_type != 'transcribe':
+            return jsonify({"error": "audio upload is only for transcribe jobs"}), 400
+        os.makedirs(JOB_FILES_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".audio", dir=JOB_FILES_DIR)
+        if not _save_upload(request.files['audio'], fd, MAX_JOB_AUDIO_BYTES):
+            os.unlink(path)
+            return jsonify({"error": "Ljudfilen är för stor"}), 400
+        payload = {"path": path}
+        audio_path = path
+    else:
+        body = request.get_json(silent=True) or {}
+        job_type = body.get("type")
+        payload = body.get("payload") or {}
+        # bot_reply jobs are only created by /bot, which builds the messages
+        if job_type in ("transcribe", "bot_reply") or not isinstance(payload, dict):
+            return jsonify({"error": f"invalid job type {job_type!r}"}), 400
+
+    try:
+        job_id = job_handler.submit(job_type, payload, user_id=user_id, max_active=job_handler.MAX_JOBS_PER_USER)
+    except job_handler.JobError as e:
+        if audio_path:
+            os.unlink(audio_path)
+        if isinstance(e, job_handler.JobLimitError):
+            return jsonify({"error": str(e)}), 429
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@jobs_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status and progress of a job."""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job_handler.job_status(job))
+
+@jobs_bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """The job's result once it is done (202 while it is queued or running)."""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    status = job_handler.job_status(job)
+    if job["status"] in ("queued", "running"):
+        return jsonify(status), 202
+    if job["status"] == "cancelled":
+        return jsonify(status)
+    if job["status"] == "failed":
+        return jsonify({**status, "error": job["error"]}), 500
+    return jsonify({**status, "result": job["result"]})
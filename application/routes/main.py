@@ -1,9 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify
 from ..functions.AI_handler import AIHandler
-from ..functions import db_handler
+from ..functions import db_handler, stt_stream
+from ..functions.deadline import in_flight
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.app_context_processor
+def inject_stt_streaming():
+    # bot.html only shows the mic button when /bot/audio is enabled
+    return {"stt_streaming": stt_stream.STREAMING_ENABLED}
+
 # Initialize AI handler
 ai_handler_instance = AIHandler()
 
@@ -24,7 +30,59 @@ def bot():
 
     return render_template('bot.html')
 
+@main_bp.route('/bot/cancel', methods=['POST'])
+def bot_cancel():
+    """Cancel the user's in-flight /bot request or handed-off turn (sent via sendBeacon when the page closes)."""
+    user_id = request.cookies.get("user_id")
+    if not user_id:
+        return jsonify({"cancelled": False})
+    # in_flight stops a request in this process at once; the bot_requests row
+    # reaches one running in another server process
+    cancelled = in_flight.cancel(user_id)
+    cancelled = db_handler.cancel_bot_request(user_id) or cancelled
+    cancelled = db_handler.cancel_jobs(user_id, "bot_reply") > 0 or cancelled
+    return jsonify({"cancelled": cancelled})
+
 @main_bp.route('/info')
 def info():
     """Render the info page (template may be empty for now)."""
-    return render_template('info.html')
\ No newline at end of file
+    return render_template('info.html')
+
+@main_bp.route('/bot/audio/<stream_id>', methods=['POST'])
+def bot_audio_chunk(stream_id):
+    """Accept one raw Float32 PCM chunk (?seq=N&rate=48000) and return the partial transcript."""
+    if not stt_stream.STREAMING_ENABLED:
+        return jsonify({"error": "Röstinmatning är avstängd"}), 404
+    user_id = request.cookies.get("user_id")
+    if not user_id:
+        return jsonify({"error": "no user_id"}), 401
+    seq = request.args.get('seq', type=int)
+    rate = request.args.get('rate', type=int)
+    if seq is None or not rate or not 8000 <= rate <= 192000:
+        return jsonify({"error": "seq and rate are required"}), 400
+    try:
+        samples = stt_stream.decode_pcm(request.get_data())
+        stream = stt_stream.streams.get_or_create((user_id, stream_id), rate, ai_handler_instance.transcribe_pcm)
+        stream.add_chunk(seq, samples)
+    except stt_stream.StreamError as e:
+        # Drop the broken recording (frees the user's stream slot)
+        stt_stream.streams.pop((user_id, stream_id))
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"partial": stream.text()})
+
+@main_bp.route('/bot/audio/<stream_id>/finish', methods=['POST'])
+def bot_audio_finish(stream_id):
+    """End a recording and return the final transcript."""
+    user_id = request.cookies.get("user_id")
+    stream = stt_stream.streams.pop((user_id, stream_id))
+    if stream is None:
+        return jsonify({"error": "Inspelningen hittades inte, försök igen"}), 404
+    try:
+        text = stream.finish()
+    except Exception as e:
+        return jsonify({"error": f"Transcription failed: {e}"}), 500
+    result = {"text": text}
+    if stream.missing:
+        # The transcript has gaps where these chunks were lost
+        result["missing_chunks"] = stream.missing
+    return jsonify(result)
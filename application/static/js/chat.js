@@ -13,6 +13,11 @@ window.initChat = function initChat() {
     return;
   }
 
+  // Hashed, cacheable URLs set by index.html; fall back to the plain paths
+  function assetUrl(path){
+    const urls = window.ASSET_URLS || {};
+    return urls[path] || (path.startsWith('img/') ? '/' + path : '/static/' + path);
+  }
   function escapeHtml(s){ return String(s).replaceAll('&','&amp;').replaceAll('<','&lt;').replaceAll('>','&gt;'); }
 
   function appendMessage(kind, text){
@@ -25,7 +30,7 @@ window.initChat = function initChat() {
     
     if(kind === 'assistant'){
       const img = document.createElement('img');
-      img.src = '/img/kjellOne.png';
+      img.src = assetUrl('img/kjellOne.png');
       img.className = 'avatar';
       img.alt = 'Kjell AI';
       wrapper.appendChild(img);
@@ -33,7 +38,7 @@ window.initChat = function initChat() {
     } else if(kind === 'user'){
       wrapper.appendChild(bubble);
       const img = document.createElement('img');
-      img.src = '/img/userIcon2.png';
+      img.src = assetUrl('img/userIcon2.png');
       img.className = 'avatar';
       img.alt = 'User';
       wrapper.appendChild(img);
@@ -48,6 +53,30 @@ window.initChat = function initChat() {
     return wrapper; // Return the wrapper for later modification
   }
 
+  // Let the server stop working on a reply nobody will read
+  if(!window.chatCancelHooked){
+    window.addEventListener('pagehide', () => {
+      if(window.chatRequestPending) navigator.sendBeacon('/bot/cancel');
+    });
+    window.chatCancelHooked = true;
+  }
+
+  // Long replies are handed to a background job; poll until it finishes
+  async function waitForJob(jobId, bubble){
+    while(true){
+      await new Promise(resolve => setTimeout(resolve, 2000));
+      const res = await fetch(`/jobs/${jobId}/result`);
+      const job = await res.json();
+      if(res.status === 202){
+        bubble.innerHTML = escapeHtml(job.message ? `AI is thinking... (${job.message})` : 'AI is thinking...');
+        continue;
+      }
+      if(!res.ok) return {reply: '(error from server)'};
+      if(job.status === 'cancelled') return {cancelled: true};
+      return job.result;
+    }
+  }
+
   // Remove any previously attached listener by cloning
   const newForm = form.cloneNode(true);
   form.parentNode.replaceChild(newForm, form);
@@ -70,19 +99,31 @@ window.initChat = function initChat() {
     try{
       const formData = new FormData();
       formData.append('message', text);
+      window.chatRequestPending = true;
       const res = await fetch(window.location.pathname || '/bot', {
         method: 'POST',
         body: formData
-      });
+      }).finally(() => { window.chatRequestPending = false; });
       if(res.ok){
-        const data = await res.json();
+        let data = await res.json();
+        if(data.job_id){
+          // Still cancellable from pagehide while the job runs
+          window.chatRequestPending = true;
+          data = await waitForJob(data.job_id, loadingBubble)
+            .finally(() => { window.chatRequestPending = false; });
+        }
+        if(data.cancelled){
+          // Superseded by a newer message; that request brings the reply
+          loadingWrapper.remove();
+          return;
+        }
         // Replace loading with response
         loadingWrapper.className = 'message assistant';
         loadingBubble.className = 'bubble assistant';
         loadingBubble.innerHTML = escapeHtml(data.reply || '(no reply)');
         // Add avatar for assistant
         const img = document.createElement('img');
-        img.src = '/img/kjellOne.png';
+        img.src = assetUrl('img/kjellOne.png');
         img.className = 'avatar';
         img.alt = 'Kjell AI';
         loadingWrapper.insertBefore(img, loadingWrapper.firstChild);
@@ -120,6 +161,103 @@ window.initChat = function initChat() {
     }
   });
 
+  // Voice input: stream microphone audio to the server while recording so
+  // the transcript is (almost) ready when the user stops talking.
+  const micBtn = newForm.querySelector('#mic-btn');
+  let recording = null;
+
+  function flushChunk(rec){
+    if(!rec.bufferedLen) return;
+    const chunk = new Float32Array(rec.bufferedLen);
+    let offset = 0;
+    for(const part of rec.buffered){ chunk.set(part, offset); offset += part.length; }
+    rec.buffered = [];
+    rec.bufferedLen = 0;
+    const seq = rec.seq++;
+    const send = () => fetch(`/bot/audio/${rec.streamId}?seq=${seq}&rate=${rec.ctx.sampleRate}`, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/octet-stream'},
+      body: chunk.buffer
+    });
+    // Send chunks one after another; the server also reorders by seq.
+    // Retry a failed chunk once (duplicates are ignored server-side).
+    rec.sending = rec.sending
+      .then(() => send().then(res => res.status >= 500 ? send() : res, () => send()))
+      .then(res => res.ok ? res.json() : null)
+      .then(data => { if(data && data.partial) newInput.placeholder = data.partial; })
+      .catch(err => console.warn('Audio chunk failed:', err));
+  }
+
+  async function startRecording(){
+    const stream = await navigator.mediaDevices.getUserMedia({audio: true});
+    const ctx = new AudioContext();
+    await ctx.audioWorklet.addModule(assetUrl('js/audio-worklet-processor.js'));
+    const source = ctx.createMediaStreamSource(stream);
+    const node = new AudioWorkletNode(ctx, 'recording-processor');
+    const rec = {stream, ctx, node, streamId: crypto.randomUUID(), seq: 0,
+                 buffered: [], bufferedLen: 0, sending: Promise.resolve()};
+    node.port.onmessage = (e) => {
+      if(e.data.type !== 'audio-data') return;
+      rec.buffered.push(e.data.data);
+      rec.bufferedLen += e.data.data.length;
+      if(rec.bufferedLen >= ctx.sampleRate / 4) flushChunk(rec); // ~250 ms per request
+    };
+    source.connect(node);
+    node.connect(ctx.destination); // keeps the worklet running; it outputs silence
+    return rec;
+  }
+
+  async function stopRecording(rec){
+    rec.node.port.onmessage = null;
+    flushChunk(rec);
+    rec.node.disconnect();
+    rec.stream.getTracks().forEach(t => t.stop());
+    rec.ctx.close();
+    await rec.sending;
+    // {text} or {error}; the server forgets a recording it could not use
+    let data;
+    try{
+      const res = await fetch(`/bot/audio/${rec.streamId}/finish`, {method: 'POST'});
+      data = await res.json().catch(() => ({}));
+      if(!res.ok) return {error: data.error || `server error ${res.status}`};
+    } catch (err) {
+      return {error: 'network error'};
+    }
+    if(data.missing_chunks) console.warn('Audio chunks lost, transcript has gaps:', data.missing_chunks);
+    return {text: data.text || ''};
+  }
+
+  if(micBtn && window.AudioWorkletNode && navigator.mediaDevices){
+    const defaultPlaceholder = newInput.placeholder;
+    micBtn.addEventListener('click', async () => {
+      if(!recording){
+        try{
+          recording = await startRecording();
+          micBtn.classList.add('recording');
+          micBtn.setAttribute('aria-pressed', 'true');
+        } catch (err) {
+          console.warn('Could not start recording:', err);
+          recording = null;
+        }
+        return;
+      }
+      const rec = recording;
+      recording = null;
+      micBtn.classList.remove('recording');
+      micBtn.setAttribute('aria-pressed', 'false');
+      const result = await stopRecording(rec);
+      newInput.placeholder = defaultPlaceholder;
+      if(result.error){
+        appendMessage('loading', `(recording failed: ${result.error})`);
+      } else if(result.text){
+        newInput.value = result.text;
+        newForm.requestSubmit();
+      }
+    });
+  } else if(micBtn){
+    micBtn.hidden = true;
+  }
+
   // focus input
   newInput.focus();
 };
@@ -0,0 +1,143 @@
+"""Small benchmarks for the chatbot, runnable from the repository root.
+
+    python bench.py serving            # dev server vs. production server
+    python bench.py serving --path /bot --concurrency 32 --duration 10
+    python bench.py image photo1.jpg photo2.png   # vision payload before/after
+"""
+import argparse
+import base64
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def load_test(url, concurrency, duration):
+    """Hit `url` from `concurrency` threads for `duration` seconds."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as resp:
+                    resp.read()
+                ok = True
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    result = {"requests": len(latencies), "errors": errors, "rps": len(latencies) / duration}
+    if latencies:
+        result["p50_ms"] = statistics.median(latencies) * 1000
+        result["p95_ms"] = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    return result
+
+
+def _wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return True
+        except Exception:
+            time.sleep(0.3)
+    return False
+
+
+def _print_row(name, r):
+    print(f"{name:<12} {r['rps']:>9.1f} req/s  p50 {r.get('p50_ms', 0):>7.1f} ms  "
+          f"p95 {r.get('p95_ms', 0):>7.1f} ms  errors {r['errors']}")
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def bench_serving(args):
+    """Start run.py in dev and production mode and compare throughput."""
+    modes = [("dev", []), ("production", ["--prod"])]
+    for name, extra in modes:
+        env = dict(os.environ, FLASK_RUN_PORT=str(args.port), FLASK_DEBUG="0")
+        cmd = [sys.executable, os.path.join(ROOT, "run.py"), *extra,
+               "--workers", str(args.workers), "--threads", str(args.threads)]
+        proc = subprocess.Popen(cmd, env=env, cwd=ROOT,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{args.port}{args.path}"
+        try:
+            if not _wait_until_up(url):
+                print(f"{name}: server did not start")
+                continue
+            load_test(url, args.concurrency, 1)  # warm up
+            _print_row(name, load_test(url, args.concurrency, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+
+
+def bench_image(args):
+    """Payload size and preprocessing time for the vision model."""
+    sys.path.insert(0, ROOT)
+    from application.functions import image_handler
+
+    for path in args.files:
+        with open(path, "rb") as f:
+            raw = f.read()
+        start = time.perf_counter()
+        prepared = image_handler.prepare_image(raw, max_side=args.max_side)
+        elapsed = (time.perf_counter() - start) * 1000
+        # Previously the raw upload was base64-encoded into the prompt text;
+        # Ollama's images field is base64 on the wire as well.
+        before = len(base64.b64encode(raw))
+        after = len(base64.b64encode(prepared))
+        print(f"{os.path.basename(path):<24} upload {len(raw):>9} B  payload {before:>9} -> {after:>8} B "
+              f"({after / before:6.1%})  prep {elapsed:6.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serving = sub.add_parser("serving", help="Throughput of the dev server vs. the production server")
+    p_serving.add_argument("--path", default="/")
+    p_serving.add_argument("--port", type=int, default=5077)
+    p_serving.add_argument("--concurrency", type=int, default=16)
+    p_serving.add_argument("--duration", type=float, default=5.0)
+    p_serving.add_argument("--workers", type=int, default=4)
+    p_serving.add_argument("--threads", type=int, default=4)
+    p_serving.set_defaults(func=bench_serving)
+
+    p_image = sub.add_parser("image", help="Vision payload size before/after image preprocessing")
+    p_image.add_argument("files", nargs="+")
+    p_image.add_argument("--max-side", type=int, default=672)
+    p_image.set_defaults(func=bench_image)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
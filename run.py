@@ -3,7 +3,12 @@
 This allows running the application with `python run.py` regardless of the
 current working directory and avoids "No module named application" import
 errors when `application` is a package.
+
+`python run.py --prod` (or SERVER_MODE=production) starts a production
+server instead of the Flask development server: gunicorn with pre-forked
+workers where available (Linux/macOS), otherwise waitress (Windows).
 """
+import argparse
 import os
 import sys
 
@@ -12,11 +17,106 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
-from application.app import app
+from application.app import app, ai_handler_instance
+from application.functions import job_handler, stt_stream
+from application.routes import jobs as jobs_routes
+
+
+def serve_gunicorn(host, port, workers, threads, timeout, graceful_timeout):
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        # In-process models (Whisper/torch) are not fork-safe, so load them
+        # in each worker after the fork.
+        ai_handler_instance.warmup()
+        # Worker threads do not survive fork, so each worker runs its own pool
+        job_handler.start_workers(ai_handler_instance)
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread" if threads > 1 else "sync")
+            # Import the app once in the master (after preload_models) and
+            # fork the workers from it.
+            self.cfg.set("preload_app", True)
+            self.cfg.set("timeout", timeout)
+            # On SIGTERM workers stop accepting and get this long to finish
+            # in-flight requests before being killed.
+            self.cfg.set("graceful_timeout", graceful_timeout)
+            self.cfg.set("post_fork", post_fork)
+
+        def load(self):
+            return app
+
+    ProductionApplication().run()
+
+
+def serve_waitress(host, port, threads, timeout):
+    import signal
+    from waitress import create_server
+
+    # Models load in this single process
+    ai_handler_instance.warmup()
+    job_handler.start_workers(ai_handler_instance)
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        channel_timeout=timeout,
+        # /jobs accepts larger audio uploads than the app-wide limit
+        max_request_body_size=max(app.config['MAX_CONTENT_LENGTH'],
+                                  jobs_routes.MAX_JOB_AUDIO_BYTES + jobs_routes.UPLOAD_OVERHEAD_BYTES),
+    )
+
+    def shutdown(signum, frame):
+        # Stop accepting connections; worker threads finish in-flight requests
+        server.close()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    try:
+        server.run()
+    except OSError:
+        # select() on the closed listening socket after shutdown
+        pass
+
+
+def serve_production(host, port, workers, threads, timeout, graceful_timeout):
+    ai_handler_instance.preload_models()
+    try:
+        import gunicorn  # noqa: F401  (not available on Windows)
+    except ImportError:
+        serve_waitress(host, port, threads, timeout)
+    else:
+        serve_gunicorn(host, port, workers, threads, timeout, graceful_timeout)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the AI chatbot server.")
+    parser.add_argument("--prod", action="store_true",
+                        default=os.environ.get("SERVER_MODE", "").lower() == "production",
+                        help="Run a production server instead of the Flask dev server")
+    # Streamed recordings live in one process's memory (see stt_stream.py)
+    default_workers = "1" if stt_stream.STREAMING_ENABLED else "2"
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", default_workers)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", "4")))
+    parser.add_argument("--timeout", type=int, default=int(os.environ.get("WEB_TIMEOUT", "300")),
+                        help="Seconds before a stuck request/worker is killed (LLM calls are slow)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "60")),
+                        help="Seconds to drain in-flight requests on SIGTERM")
+    args = parser.parse_args()
+    if args.prod and args.workers > 1 and stt_stream.STREAMING_ENABLED:
+        parser.error("--workers > 1 needs STT_STREAMING=0: streamed recordings are kept in one "
+                     "worker's memory, so their chunks would land in different workers")
+
     # Use env vars if provided
     debug = os.environ.get("FLASK_DEBUG", "0") in ("1", "true", "True")
     host = os.environ.get("FLASK_RUN_HOST", "127.0.0.1")
     port = int(os.environ.get("FLASK_RUN_PORT", "5000"))
-    app.run(host=host, port=port, debug=debug)
+    if args.prod:
+        serve_production(host, port, args.workers, args.threads, args.timeout, args.graceful_timeout)
+    else:
+        app.run(host=host, port=port, debug=debug)
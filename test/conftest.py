@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+# The app refuses to start without a secret key outside debug, and admin
+# login needs ADMIN_PASSWORD; set both before any test imports the app.
+os.environ.setdefault("FLASK_SECRET_KEY", "test-secret")
+os.environ.setdefault("ADMIN_PASSWORD", "123")
+
+
+class FakeStream:
+    """A streamed Ollama response: str chunks become chat messages, dicts are yielded as they are."""
+
+    def __init__(self, chunks, on_chunk=None):
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+        self.closed = False
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if self.on_chunk:
+                self.on_chunk(i)
+            yield {"message": {"content": chunk}} if isinstance(chunk, str) else chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeOllama:
+    """
+    Stands in for ollama.Client. Every chat/generate call returns
+    `reply(method, **kwargs)` (a FakeStream, or a list of chunks); the
+    timeout of each client created is kept in `timeouts`.
+    """
+
+    def __init__(self):
+        self.timeouts = []
+        self.reply = lambda method, **kwargs: FakeStream([])
+
+    def stream(self, chunks, on_chunk=None):
+        """Answer every call with one stream of `chunks` and return it."""
+        stream = FakeStream(chunks, on_chunk)
+        self.reply = lambda method, **kwargs: stream
+        return stream
+
+    def client(self, timeout=None):
+        self.timeouts.append(timeout)
+        fake = self
+
+        class FakeClient:
+            def chat(self, model, stream=False, **kwargs):
+                return fake._call("chat", model=model, **kwargs)
+
+            def generate(self, model, stream=False, **kwargs):
+                return fake._call("generate", model=model, **kwargs)
+
+        return FakeClient()
+
+    def _call(self, method, **kwargs):
+        result = self.reply(method, **kwargs)
+        return result if isinstance(result, FakeStream) else FakeStream(result)
+
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    from application.functions import AI_handler
+    fake = FakeOllama()
+    monkeypatch.setattr(AI_handler.ollama, "Client", fake.client)
+    return fake
@@ -0,0 +1,60 @@
+import gzip
+
+import pytest
+
+from application.app import app as flask_app
+from application.functions import asset_handler
+
+
+@pytest.fixture
+def client():
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        yield client
+
+
+def test_manifest_hashes_and_compresses(tmp_path):
+    (tmp_path / "static" / "css").mkdir(parents=True)
+    (tmp_path / "img").mkdir()
+    css = b"body { color: red; }\n" * 50
+    (tmp_path / "static" / "css" / "site.css").write_bytes(css)
+    (tmp_path / "img" / "logo.png").write_bytes(b"\x89PNG" + bytes(500))
+
+    manifest = asset_handler.AssetManifest({"": str(tmp_path / "static"), "img": str(tmp_path / "img")})
+    site = manifest.get("css/site.css")
+    assert site.url == f"/assets/{site.digest}/css/site.css"
+    assert gzip.decompress(site.bodies["gzip"]) == css
+    # Images are not recompressed
+    assert set(manifest.get("img/logo.png").bodies) == {"identity"}
+    assert manifest.url_for("css/missing.css") == "/static/css/missing.css"
+
+    (tmp_path / "static" / "css" / "site.css").write_bytes(b"body{}")
+    manifest.build()
+    assert manifest.get("css/site.css").digest != site.digest
+
+
+def test_index_links_fingerprinted_assets(client):
+    html = client.get('/').get_data(as_text=True)
+    assert asset_handler.asset_url('css/index_style.css') in html
+    assert asset_handler.asset_url('img/kjellOne.png') in html
+    assert "/static/js/chat.js" not in html
+
+
+def test_asset_route_caching_and_encoding(client):
+    url = asset_handler.asset_url('js/chat.js')
+    r = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in r.headers["Cache-Control"]
+    assert r.headers["Vary"] == "Accept-Encoding"
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzip.decompress(r.data) == plain.data
+
+    r304 = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": r.headers["ETag"]})
+    assert r304.status_code == 304 and not r304.data
+
+    stale = client.get('/assets/000000000000/js/chat.js')
+    assert stale.status_code == 200 and stale.headers["Cache-Control"] == "no-cache"
+    assert client.get('/assets/000000000000/js/nope.js').status_code == 404
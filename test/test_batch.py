@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from application.functions import batch_handler
+
+
+class FakeHandler:
+    default_chat_model = "chat-model"
+    default_reason_model = "reason-model"
+
+    def __init__(self, delays=None, fail=()):
+        self.delays = delays or {}
+        self.fail = set(fail)
+        self.active = {}
+        self.max_active = {}
+        self.lock = threading.Lock()
+
+    def complete(self, model, prompt):
+        with self.lock:
+            self.active[model] = self.active.get(model, 0) + 1
+            self.max_active[model] = max(self.max_active.get(model, 0), self.active[model])
+        try:
+            time.sleep(self.delays.get(prompt, 0.01))
+            if prompt in self.fail:
+                raise RuntimeError("model exploded")
+            return f"{model}:{prompt}"
+        finally:
+            with self.lock:
+                self.active[model] -= 1
+
+
+def _lines(items):
+    return [json.dumps(i) for i in items]
+
+
+def test_parse_ndjson_assigns_ids_and_flags_bad_lines():
+    items = list(batch_handler.parse_ndjson(['{"prompt": "a"}', "", "not json", '{"id": "x", "prompt": "b"}']))
+    assert [i["id"] for i in items] == [0, 2, "x"]
+    assert "_error" in items[1]
+
+
+def test_run_batch_keeps_input_order_and_reports_errors():
+    handler = FakeHandler(delays={"slow": 0.1}, fail={"boom"})
+    items = batch_handler.parse_ndjson(_lines([
+        {"prompt": "slow"},
+        {"prompt": "fast", "mode": "reason"},
+        {"prompt": "boom"},
+        {"prompt": "x", "mode": "nope"},
+        {"mode": "chat"},
+        {"prompt": "legacy", "mode": "call_ll"},
+    ]))
+    stats = batch_handler.BatchStats()
+    results = list(batch_handler.run_batch(handler, items, workers=4, stats=stats))
+
+    assert [r["index"] for r in results] == list(range(6))
+    assert results[0]["text"] == "chat-model:slow"
+    assert results[1]["model"] == "reason-model"
+    assert results[2]["ok"] is False and "exploded" in results[2]["error"]
+    assert "unknown mode" in results[3]["error"]
+    assert results[4]["error"] == "missing prompt"
+    assert results[5]["model"] == batch_handler.chatbot.MODEL
+    snap = stats.snapshot()
+    assert snap["ok"] == 3 and snap["errors"] == 3
+
+
+def test_run_batch_completion_order_and_per_model_limit():
+    handler = FakeHandler(delays={"slow": 0.2})
+    items = [{"id": i, "prompt": "slow" if i == 0 else f"p{i}"} for i in range(8)]
+    results = list(batch_handler.run_batch(handler, items, workers=4, per_model=2, ordered=False))
+    assert len(results) == 8
+    assert results[-1]["id"] == 0
+    assert handler.max_active["chat-model"] <= 2
+
+
+def test_busy_model_does_not_block_workers_for_other_models():
+    handler = FakeHandler(delays={"slow": 0.3})
+    items = [{"id": f"a{i}", "prompt": "slow", "model": "A"} for i in range(6)]
+    items += [{"id": f"b{i}", "prompt": f"p{i}", "model": "B"} for i in range(4)]
+    start = time.monotonic()
+    results = []
+    for result in batch_handler.run_batch(handler, items, workers=4, per_model=2, ordered=False):
+        results.append((result["id"], time.monotonic() - start))
+
+    # B's items finish while A's first items are still running
+    assert sorted(rid for rid, _ in results[:4]) == ["b0", "b1", "b2", "b3"]
+    assert results[3][1] < 0.3
+    assert handler.max_active["A"] <= 2 and handler.max_active["B"] <= 2
+    assert len(results) == 10
+
+
+def test_resume_skips_completed_ids(tmp_path):
+    out = tmp_path / "results.ndjson"
+    out.write_text(json.dumps({"id": "a", "ok": True}) + "\n" + json.dumps({"id": "b", "ok": False}) + "\n{trunc")
+    done = batch_handler.completed_ids(str(out))
+    assert done == {"a"}
+
+    stats = batch_handler.BatchStats()
+    items = [{"id": "a", "prompt": "1"}, {"id": "b", "prompt": "2"}]
+    results = list(batch_handler.run_batch(FakeHandler(), items, skip_ids=done, stats=stats))
+    assert [r["id"] for r in results] == ["b"]
+    assert stats.skipped == 1
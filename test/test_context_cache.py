@@ -0,0 +1,76 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from application.functions import AI_handler, context_cache, db_handler
+from application.functions.AI_handler import AIHandler
+
+
+class FakeRequest:
+    def __init__(self, message, model=None):
+        self.files = {}
+        self.form = MultiDict({"message": message, **({"model": model} if model else {})})
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "ctx.db"))
+    db_handler.init_db()
+    monkeypatch.setattr(context_cache, "cache", context_cache.ContextCache())
+
+
+@pytest.fixture
+def generate_calls(fake_ollama):
+    calls = []
+
+    def reply(method, model, prompt=None, system=None, context=None):
+        calls.append({"model": model, "prompt": prompt, "system": system, "context": context})
+        new_context = list(context or []) + [len(calls)]
+        return [
+            {"response": f"reply {len(calls)}", "done": False},
+            {"response": "", "done": True, "context": new_context},
+        ]
+
+    fake_ollama.reply = reply
+    return calls
+
+
+def test_context_cache_lookup_rules():
+    cache = context_cache.ContextCache(max_users=1)
+    cache.store("u", context_cache.ContextState("m", 5, [1, 2, 3]))
+    assert cache.lookup("u", "m", 5, max_tokens=10) is not None
+    assert cache.lookup("u", "other", 5, max_tokens=10) is None
+    assert cache.lookup("u", "m", 6, max_tokens=10) is None
+    assert cache.lookup("u", "m", 5, max_tokens=2) is None
+    cache.store("v", context_cache.ContextState("m", 1, []))
+    assert cache.lookup("u", "m", 5, max_tokens=10) is None  # evicted
+
+
+def test_turns_reuse_context_and_fall_back_on_change(temp_db, generate_calls):
+    handler = AIHandler({"context_reuse": "1", "routing": "0", "default_chat_model": "chat"})
+
+    assert handler.handle_bot_request(FakeRequest("hello knight"), "u1") == {"reply": "reply 1"}
+    first = generate_calls[0]
+    assert first["system"] == AI_handler.SYSTEM_PROMPT
+    assert first["context"] is None
+
+    # second turn only sends the new message plus the stored context
+    handler.handle_bot_request(FakeRequest("tell me more"), "u1")
+    second = generate_calls[1]
+    assert second["prompt"] == "tell me more"
+    assert second["context"] == [1]
+    assert second["system"] is None
+
+    # a different model falls back to a full replay of the history
+    handler.handle_bot_request(FakeRequest("and then?", model="other"), "u1")
+    third = generate_calls[2]
+    assert third["context"] is None
+    assert third["system"] == AI_handler.SYSTEM_PROMPT
+    assert "User: hello knight" in third["prompt"]
+    assert "Assistant: reply 2" in third["prompt"]
+    assert third["prompt"].endswith("and then?")
+
+    # history changed behind our back (e.g. admin cleared it): full replay
+    db_handler.clear_events("u1")
+    handler.handle_bot_request(FakeRequest("hello again", model="other"), "u1")
+    assert generate_calls[3]["context"] is None
+    assert generate_calls[3]["prompt"] == "hello again"
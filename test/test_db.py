@@ -82,3 +82,23 @@ def test_list_users(temp_db):
     users = db.list_users()
     ids = [u[0] for u in users]
     assert "a" in ids and "b" in ids
+
+
+def test_get_chat_history_window_moves_in_blocks(temp_db):
+    db = temp_db
+    user_id = "u-window"
+    db.add_user(user_id, "")
+    ids = [db.add_event(user_id, "chat_user", f"m{i}") for i in range(25)]
+    assert ids == sorted(ids)
+
+    rows = db.get_chat_history(user_id, window=20, step=10)
+    # 25 events: window start stays at 0 until 30 events exist
+    assert [r[2] for r in rows][0] == "m0"
+    assert len(rows) == 25
+
+    for i in range(25, 30):
+        db.add_event(user_id, "chat_llm", f"m{i}")
+    rows = db.get_chat_history(user_id, window=20, step=10)
+    assert rows[0][2] == "m10"
+    assert len(rows) == 20
+    assert rows[-1] == (ids[-1] + 5, "chat_llm", "m29")
@@ -0,0 +1,120 @@
+import time
+import pytest
+
+from application.functions import deadline as dl
+from application.functions.AI_handler import AIHandler
+
+
+def test_deadline_check_and_cancel():
+    d = dl.Deadline(10)
+    d.check("llm")
+    assert 9 < d.remaining() <= 10
+    assert d.stage_timeout(3) == 3
+    d.cancel("gone")
+    with pytest.raises(dl.Cancelled):
+        d.check("llm")
+
+    expired = dl.Deadline(0)
+    with pytest.raises(dl.DeadlineExceeded):
+        expired.check("stt")
+
+
+def test_in_flight_retry_supersedes_previous_request():
+    registry = dl.InFlightRequests()
+    first = registry.start("u", 10)
+    second = registry.start("u", 10)
+    assert first.cancelled and not second.cancelled
+    assert registry.cancel("u") is True
+    assert second.cancelled
+    assert registry.cancel("u") is False
+
+
+def test_metrics_estimate_saved_time():
+    m = dl.StageMetrics()
+    m.stage_completed("llm", 10.0)
+    m.stage_aborted("llm", 4.0, timed_out=False)
+    m.stages_skipped(["llm"])
+    snap = m.snapshot()
+    assert snap["cancellations"] == {"llm": 1}
+    assert snap["seconds_spent_on_aborted"] == 4.0
+    assert snap["seconds_saved_estimate"] == 16.0
+
+
+def test_parse_timeouts():
+    assert dl.parse_timeouts("llava:13b=45, llama2:7b=90") == {"llava:13b": 45.0, "llama2:7b": 90.0}
+    assert dl.parse_timeouts(None) == {}
+
+
+def test_stream_chat_stops_and_closes_when_cancelled(fake_ollama):
+    handler = AIHandler()
+    d = dl.Deadline(60)
+    stream = fake_ollama.stream(["a", "b", "c", "d"], on_chunk=lambda i: i == 1 and d.cancel())
+
+    with pytest.raises(dl.Cancelled):
+        handler._stream_chat("m", [], d, "llm")
+    assert stream.closed
+
+
+def test_stream_chat_enforces_per_model_timeout(fake_ollama):
+    handler = AIHandler({"model_timeouts": {"slow": 0.05}})
+    stream = fake_ollama.stream(["a"] * 5, on_chunk=lambda i: time.sleep(0.03))
+
+    with pytest.raises(dl.DeadlineExceeded):
+        handler._stream_chat("slow", [], dl.Deadline(60), "llm")
+    assert stream.closed
+
+
+@pytest.mark.parametrize("outcome", ["cancelled", "timed_out"])
+def test_cancelled_turns_are_not_logged(outcome, tmp_path, monkeypatch, fake_ollama):
+    from flask import Flask, request
+    from application.functions import db_handler
+
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "bot.db"))
+    db_handler.init_db()
+    handler = AIHandler({"routing": "0", "context_reuse": "0", "job_handoff": "0"})
+    if outcome == "cancelled":
+        on_chunk = lambda i: i == 1 and dl.in_flight.cancel("u1")
+    else:
+        on_chunk = lambda i: i == 1 and time.sleep(0.05)
+        handler.request_deadline = 0.02
+    fake_ollama.stream(["a", "b", "c"], on_chunk)
+
+    with Flask(__name__).test_request_context('/bot', method='POST', data={"message": "hello"}):
+        result = handler.handle_bot_request(request, "u1")
+
+    history = db_handler.get_chat_history("u1")
+    if outcome == "cancelled":
+        assert result == {"cancelled": True}
+        assert history == []
+    else:
+        assert result["reply"].startswith("(Fallback)")
+        assert [(t, c) for _, t, c in history] == [("chat_user", "hello"), ("chat_llm", result["reply"])]
+
+
+@pytest.mark.parametrize("other_process", ["cancel", "retry"])
+def test_bot_request_is_cancelled_from_another_process(other_process, tmp_path, monkeypatch, fake_ollama):
+    from flask import Flask, request
+    from application.functions import db_handler
+
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(dl, "CANCEL_POLL_SECONDS", 0)
+    db_handler.init_db()
+    handler = AIHandler({"routing": "0", "context_reuse": "0", "job_handoff": "0"})
+
+    # Another worker only shares the database, not this process's in_flight
+    def elsewhere(i):
+        if i == 1:
+            if other_process == "cancel":
+                db_handler.cancel_bot_request("u1")
+            else:
+                db_handler.start_bot_request("u1", "newer")
+    stream = fake_ollama.stream(["a", "b", "c"], elsewhere)
+
+    with Flask(__name__).test_request_context('/bot', method='POST', data={"message": "hello"}):
+        result = handler.handle_bot_request(request, "u1")
+
+    assert result == {"cancelled": True}
+    assert stream.closed
+    assert db_handler.get_chat_history("u1") == []
+    # the newer request's row is left alone
+    assert db_handler.cancel_bot_request("u1") is (other_process == "retry")
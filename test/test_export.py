@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+import pytest
+
+from application.functions import db_handler, export_handler
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "test_database.db"
+    monkeypatch.setattr(db_handler, "DB_NAME", str(db_path))
+    db_handler.init_db()
+    yield db_handler
+
+
+def _seed(db, users=3, events_per_user=4):
+    for u in range(users):
+        user_id = f"user-{u}"
+        db.add_user(user_id, f"info {u}")
+        for e in range(events_per_user):
+            db.add_event(user_id, "chat_user", f"msg {u}-{e}")
+
+
+def test_iter_all_events_is_ordered_and_resumable(temp_db):
+    db = temp_db
+    _seed(db)
+    rows = list(db.iter_all_events(batch_size=5))
+    ids = [r[0] for r in rows]
+    assert len(rows) == 12
+    assert ids == sorted(ids)
+
+    tail = list(db.iter_all_events(after_event_id=ids[5], batch_size=5))
+    assert [r[0] for r in tail] == ids[6:]
+
+
+def test_export_and_import_round_trip(temp_db, tmp_path, monkeypatch):
+    db = temp_db
+    _seed(db)
+    out_dir = tmp_path / "archive"
+
+    checkpoint = export_handler.export_archive(str(out_dir), shard_size=5)
+    assert checkpoint["done"] is True
+    assert checkpoint["events"] == 12
+    assert checkpoint["next_shard"] == 3
+    assert os.path.exists(out_dir / "events-00002.ndjson.gz")
+
+    # restore into an empty database
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "restored.db"))
+    db_handler.init_db()
+    counts = export_handler.import_archive(str(out_dir), batch_size=4)
+    assert counts == {"users": 3, "events": 12}
+    assert sorted(u[0] for u in db_handler.list_users()) == ["user-0", "user-1", "user-2"]
+    assert len(db_handler.get_events("user-1")) == 4
+
+    # importing again is idempotent and reports nothing inserted
+    assert export_handler.import_archive(str(out_dir)) == {"users": 0, "events": 0}
+    assert len(list(db_handler.iter_all_events())) == 12
+
+
+def test_import_conflicting_ids_fails_or_appends(temp_db, tmp_path, monkeypatch):
+    _seed(temp_db, users=1, events_per_user=2)
+    out_dir = str(tmp_path / "archive")
+    export_handler.export_archive(out_dir)
+
+    # a database whose event 1 is something else
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "other.db"))
+    db_handler.init_db()
+    db_handler.add_event("someone", "chat_user", "unrelated")
+
+    with pytest.raises(db_handler.ImportConflict):
+        export_handler.import_archive(out_dir)
+    assert len(list(db_handler.iter_all_events())) == 1
+
+    counts = export_handler.import_archive(out_dir, mode="append")
+    # the user was already inserted by the failed attempt
+    assert counts == {"users": 0, "events": 2}
+    rows = list(db_handler.iter_all_events())
+    assert [r[0] for r in rows] == [1, 2, 3]
+    assert rows[0][3] == "unrelated"
+
+
+def test_export_resumes_from_checkpoint(temp_db, tmp_path):
+    db = temp_db
+    _seed(db, users=1, events_per_user=3)
+    out_dir = str(tmp_path / "archive")
+    export_handler.export_archive(out_dir, shard_size=2)
+
+    # new events after a finished export only land in new shards
+    db.add_event("user-0", "chat_llm", "later")
+    checkpoint = export_handler.export_archive(out_dir, shard_size=2)
+    assert checkpoint["events"] == 4
+    assert checkpoint["next_shard"] == 3
+    with gzip.open(os.path.join(out_dir, "events-00002.ndjson.gz"), "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["content"] for r in records] == ["later"]
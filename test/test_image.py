@@ -0,0 +1,52 @@
+import io
+import pytest
+from PIL import Image
+
+from application.functions import image_handler
+
+
+def _encode(img, fmt, **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def test_prepare_image_downscales_to_jpeg():
+    raw = _encode(Image.new("RGB", (3000, 2000), (10, 120, 200)), "PNG")
+    out = image_handler.prepare_image(raw, max_side=672)
+    img = Image.open(io.BytesIO(out))
+    assert img.format == "JPEG"
+    assert max(img.size) == 672
+    assert img.size == (672, 448)
+
+
+def test_prepare_image_strips_exif_and_applies_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees
+    exif[0x010F] = "PhoneMaker"
+    raw = _encode(Image.new("RGB", (400, 200)), "JPEG", exif=exif)
+    out = image_handler.prepare_image(raw)
+    img = Image.open(io.BytesIO(out))
+    assert img.size == (200, 400)
+    assert len(img.getexif()) == 0
+
+
+def test_prepare_image_flattens_transparency():
+    raw = _encode(Image.new("RGBA", (50, 50), (0, 0, 0, 0)), "PNG")
+    img = Image.open(io.BytesIO(image_handler.prepare_image(raw)))
+    assert img.mode == "RGB"
+    assert img.getpixel((25, 25))[0] > 240
+
+
+def test_prepare_image_rejects_invalid_uploads(monkeypatch):
+    with pytest.raises(image_handler.ImageError):
+        image_handler.prepare_image(b"")
+    with pytest.raises(image_handler.ImageError):
+        image_handler.prepare_image(b"definitely not an image")
+    raw = _encode(Image.new("RGB", (200, 200)), "PNG")
+    with pytest.raises(image_handler.ImageError):
+        image_handler.prepare_image(raw, max_pixels=100 * 100)
+    # Pillow's own decompression-bomb check fires in Image.open
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(image_handler.ImageError):
+        image_handler.prepare_image(raw)
@@ -0,0 +1,231 @@
+import time
+
+import pytest
+
+from application.app import app as flask_app
+from application.functions import db_handler, job_handler
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "jobs.db"))
+    db_handler.init_db()
+    yield db_handler
+
+
+class IdlePool:
+    """Stands in for the worker pool so tests control when jobs run."""
+
+    def notify(self):
+        pass
+
+
+@pytest.fixture
+def no_workers(monkeypatch):
+    monkeypatch.setattr(job_handler, "start_workers", lambda handler=None: IdlePool())
+
+
+def test_claim_is_fifo_and_exclusive(temp_db):
+    temp_db.add_job("a", "u1", "reason", {"prompt": "first"})
+    temp_db.add_job("b", "u1", "reason", {"prompt": "second"})
+    temp_db.add_job("c", "u1", "transcribe", {"path": "x"})
+
+    first = temp_db.claim_job("reason")
+    assert first["job_id"] == "a" and first["status"] == "running"
+    assert first["payload"] == {"prompt": "first"}
+    assert temp_db.claim_job("reason")["job_id"] == "b"
+    assert temp_db.claim_job("reason") is None
+
+
+def test_claim_on_empty_queue_does_not_lock(temp_db):
+    import sqlite3
+    # Another connection holds the write lock; an idle poll must not wait for it
+    locker = sqlite3.connect(temp_db.DB_NAME, isolation_level=None)
+    locker.execute('BEGIN IMMEDIATE')
+    try:
+        start = time.monotonic()
+        assert temp_db.claim_job("reason") is None
+        assert time.monotonic() - start < 1
+    finally:
+        locker.execute('ROLLBACK')
+        locker.close()
+
+
+def test_add_job_caps_active_jobs_per_user(temp_db):
+    assert temp_db.add_job("a", "u1", "reason", {}, max_active=2)
+    assert temp_db.add_job("b", "u1", "reason", {}, max_active=2)
+    assert not temp_db.add_job("c", "u1", "reason", {}, max_active=2)
+    assert temp_db.get_job("c") is None
+    assert temp_db.add_job("d", "u2", "reason", {}, max_active=2)
+
+    temp_db.claim_job("reason")
+    temp_db.finish_job("a", result={})
+    assert temp_db.add_job("c", "u1", "reason", {}, max_active=2)
+
+
+def test_finish_and_expiry(temp_db):
+    temp_db.add_job("a", "u1", "reason", {})
+    temp_db.claim_job("reason")
+    temp_db.update_job_progress("a", 0.5, "halfway")
+    assert temp_db.get_job("a")["message"] == "halfway"
+
+    temp_db.finish_job("a", result={"text": "42"}, ttl=60)
+    job = temp_db.get_job("a")
+    assert job["status"] == "done" and job["result"] == {"text": "42"}
+
+    temp_db.finish_job("a", error="boom", ttl=-1)
+    assert temp_db.get_job("a") is None
+    assert temp_db.delete_expired_jobs() == 1
+
+
+def test_stale_running_jobs_are_requeued(temp_db):
+    temp_db.add_job("a", "u1", "reason", {})
+    temp_db.claim_job("reason")
+    assert temp_db.requeue_stale_jobs(3600) == 0
+    time.sleep(0.01)
+    assert temp_db.requeue_stale_jobs(0) == 1
+    assert temp_db.get_job("a")["status"] == "queued"
+
+
+def test_run_job_stores_result_or_error(temp_db, monkeypatch):
+    monkeypatch.setitem(job_handler.JOB_TYPES, "echo", {"run": lambda ctx: {"echo": ctx.payload["x"]}, "concurrency": 1})
+    pool = job_handler.JobWorkerPool(handler=None)
+
+    temp_db.add_job("ok", "u1", "echo", {"x": 1})
+    temp_db.add_job("bad", "u1", "echo", {})
+    pool.run_job(temp_db.claim_job("echo"))
+    pool.run_job(temp_db.claim_job("echo"))
+
+    assert temp_db.get_job("ok")["result"] == {"echo": 1}
+    failed = temp_db.get_job("bad")
+    assert failed["status"] == "failed" and "x" in failed["error"]
+
+
+def test_job_routes(temp_db, no_workers):
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        assert client.post('/jobs', json={"type": "reason", "payload": {"prompt": "hi"}}).status_code == 401
+
+        client.set_cookie('user_id', 'u1')
+        assert client.post('/jobs', json={"type": "nope"}).status_code == 400
+        assert client.post('/jobs', json={"type": "bot_reply", "payload": {}}).status_code == 400
+        r = client.post('/jobs', json={"type": "reason", "payload": {"prompt": "hi"}})
+        assert r.status_code == 202
+        job_id = r.get_json()["job_id"]
+
+        assert client.get(f'/jobs/{job_id}').get_json()["status"] == "queued"
+        assert client.get(f'/jobs/{job_id}/result').status_code == 202
+
+        temp_db.claim_job("reason")
+        temp_db.finish_job(job_id, result={"text": "hello"})
+        r = client.get(f'/jobs/{job_id}/result')
+        assert r.status_code == 200 and r.get_json()["result"] == {"text": "hello"}
+
+        # Other users cannot see the job
+        client.set_cookie('user_id', 'u2')
+        assert client.get(f'/jobs/{job_id}').status_code == 404
+
+
+def test_job_route_limits_active_jobs(temp_db, no_workers, monkeypatch):
+    monkeypatch.setattr(job_handler, "MAX_JOBS_PER_USER", 2)
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        client.set_cookie('user_id', 'u1')
+        body = {"type": "reason", "payload": {"prompt": "hi"}}
+        assert [client.post('/jobs', json=body).status_code for _ in range(3)] == [202, 202, 429]
+
+
+def test_audio_jobs_may_exceed_the_app_upload_limit(temp_db, no_workers, tmp_path, monkeypatch):
+    import io
+    from application.routes import jobs as jobs_routes
+    monkeypatch.setitem(flask_app.config, 'MAX_CONTENT_LENGTH', 1000)
+    monkeypatch.setattr(jobs_routes, "MAX_JOB_AUDIO_BYTES", 5000)
+    monkeypatch.setattr(jobs_routes, "UPLOAD_OVERHEAD_BYTES", 1000)
+    monkeypatch.setattr(jobs_routes, "COPY_CHUNK_BYTES", 1024)
+    files_dir = tmp_path / "files"
+    monkeypatch.setattr(jobs_routes, "JOB_FILES_DIR", str(files_dir))
+
+    def upload(size):
+        data = {"type": "transcribe", "audio": (io.BytesIO(b"x" * size), "a.wav")}
+        return client.post('/jobs', data=data, content_type='multipart/form-data')
+
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        client.set_cookie('user_id', 'u1')
+        r = upload(4000)
+        assert r.status_code == 202
+        assert temp_db.get_job(r.get_json()["job_id"])["payload"]["path"].startswith(str(files_dir))
+        # over the audio limit: stopped while copying, nothing left on disk
+        assert upload(5500).status_code == 400
+        assert len(list(files_dir.iterdir())) == 1
+        # far over it: rejected while the body is read
+        assert upload(20000).status_code == 413
+        # other requests keep the app-wide limit
+        assert client.post('/jobs', json={"type": "reason", "payload": {"prompt": "x" * 2000}}).status_code == 413
+
+
+def test_hand_off_is_opt_in_and_needs_a_strong_signal():
+    from application.functions.AI_handler import AIHandler
+    long_message = "x" * 700
+    handler = AIHandler({"routing": "1", "job_handoff": "0"})
+    assert not handler._should_hand_off({}, long_message, 0, None, None)
+    assert handler._should_hand_off({"async": "1"}, "hi", 0, None, None)
+
+    handler = AIHandler({"routing": "1", "job_handoff": "1"})
+    assert not handler._should_hand_off({}, "Prove that 2 + 2 = 4", 0, None, None)
+    assert not handler._should_hand_off({}, "Why does the king wear a crown?", 0, None, None)
+    assert handler._should_hand_off({}, long_message, 0, None, None)
+    assert handler._should_hand_off({}, "Why?\n```\nx = f(1)\n```", 0, None, None)
+    assert not handler._should_hand_off({"model": "m"}, long_message, 0, None, None)
+
+
+def test_bot_request_hands_off_long_turns(temp_db, no_workers):
+    from application.functions.AI_handler import AIHandler
+    handler = AIHandler({"default_reason_model": "big", "routing": "1", "job_handoff": "1"})
+    message = "Why does this crash?\n```\n" + "x = load(1)\n" * 5 + "```"
+
+    with flask_app.test_request_context('/bot', method='POST', data={"message": message}):
+        from flask import request
+        result = handler.handle_bot_request(request, "u1")
+
+    job = temp_db.get_job(result["job_id"])
+    assert job["job_type"] == "bot_reply" and job["user_id"] == "u1"
+    assert job["payload"]["model"] == "big"
+    assert job["payload"]["messages"][-1] == {"role": "user", "content": message}
+
+
+def test_jobs_use_the_job_timeout_not_the_llm_timeout(temp_db, fake_ollama):
+    from application.functions import AI_handler
+    handler = AI_handler.AIHandler({"stage_timeouts": {"llm": 120, "job": 1800}, "model_timeouts": {"big": 60}})
+    fake_ollama.stream(["4", "2"])
+
+    temp_db.add_job("a", "u1", "reason", {"prompt": "think hard", "model": "big"})
+    job_handler.JobWorkerPool(handler).run_job(temp_db.claim_job("reason"))
+
+    assert temp_db.get_job("a")["result"]["text"] == "42"
+    assert len(fake_ollama.timeouts) == 1 and 1790 < fake_ollama.timeouts[0] <= 1800
+
+
+def test_cancelled_bot_reply_job_stops_and_logs_nothing(temp_db, monkeypatch, fake_ollama):
+    from application.functions import AI_handler
+    monkeypatch.setattr(job_handler, "CANCEL_POLL_SECONDS", 0)
+    fake_ollama.stream(["a", "b", "c"], on_chunk=lambda i: i == 1 and temp_db.cancel_jobs("u1", "bot_reply"))
+
+    temp_db.add_job("j", "u1", "bot_reply", {"model": "m", "messages": [], "user_message": "hi", "logged_input": "hi"})
+    job_handler.JobWorkerPool(AI_handler.AIHandler()).run_job(temp_db.claim_job("bot_reply"))
+
+    assert temp_db.get_job("j")["status"] == "cancelled"
+    assert temp_db.get_chat_history("u1") == []
+
+
+def test_new_bot_request_and_cancel_route_cancel_handed_off_turns(temp_db, no_workers):
+    temp_db.add_job("old", "u1", "bot_reply", {})
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        client.set_cookie('user_id', 'u1')
+        assert client.post('/bot/cancel').get_json() == {"cancelled": True}
+        assert client.get('/jobs/old/result').get_json()["status"] == "cancelled"
+
+        temp_db.add_job("queued", "u1", "bot_reply", {})
+        client.post('/bot', data={"message": ""})
+        assert temp_db.get_job("queued")["status"] == "cancelled"
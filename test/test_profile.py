@@ -0,0 +1,68 @@
+import pytest
+
+from application.app import app as flask_app
+from application.functions import profile_handler
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_handler, "PROFILE_DIR", str(tmp_path))
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        yield client
+
+
+def test_profile_flag_is_admin_only(client):
+    r = client.get('/info', headers={'X-Profile': '1'})
+    assert 'X-Profile-Id' not in r.headers
+
+    client.post('/admin/login', data={'password': '123'})
+    r = client.get('/info?_profile=1')
+    profile_id = r.headers['X-Profile-Id']
+
+    profiles = client.get('/admin/profiles').get_json()
+    assert [p['id'] for p in profiles] == [profile_id]
+    assert profiles[0]['path'] == '/info' and profiles[0]['trigger'] == 'admin'
+
+    detail = client.get(f'/admin/profiles/{profile_id}?top=5').get_json()
+    assert detail['mode'] == 'cprofile'
+    assert 0 < len(detail['top']) <= 5
+    assert {'function', 'calls', 'self_seconds', 'total_seconds'} <= set(detail['top'][0])
+
+    text = client.get(f'/admin/profiles/{profile_id}?format=text').get_data(as_text=True)
+    assert 'function calls' in text
+    download = client.get(f'/admin/profiles/{profile_id}/download')
+    assert download.status_code == 200 and download.data
+    assert client.get('/admin/profiles/..%2Fetc/download').status_code == 404
+
+
+def test_profile_routes_require_admin(client):
+    r = client.get('/admin/profiles')
+    assert r.status_code == 302
+
+
+def test_sampled_mode_profiles_one_in_n(client, monkeypatch):
+    monkeypatch.setattr(profile_handler, "PROFILE_SAMPLE_RATE", 2)
+    monkeypatch.setattr(profile_handler, "_request_counter", 0)
+    ids = [client.get('/info').headers.get('X-Profile-Id') for _ in range(4)]
+    assert ids[0] is None and ids[2] is None
+    assert ids[1] and ids[3]
+    assert profile_handler.get_profile(ids[1])['mode'] == 'sample'
+
+
+def test_sampler_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_handler, "PROFILE_DIR", str(tmp_path))
+    (tmp_path / "p1.folded").write_text("main;handler;slow 8\nmain;handler 2\nmain;other 1\n")
+    top = profile_handler.summarize("p1", "sample", top=2)
+    assert top[0] == {"function": "slow", "self_samples": 8, "total_samples": 8}
+    assert top[1] == {"function": "handler", "self_samples": 2, "total_samples": 10}
+
+
+def test_prune_keeps_newest(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_handler, "PROFILE_DIR", str(tmp_path))
+    for i in range(3):
+        (tmp_path / f"2026010{i}-000000-aaaa.json").write_text("{}")
+        (tmp_path / f"2026010{i}-000000-aaaa.prof").write_text("")
+    profile_handler.prune(keep=2)
+    assert sorted(p.name for p in tmp_path.iterdir())[0].startswith("20260101")
+    assert len(list(tmp_path.iterdir())) == 4
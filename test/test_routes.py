@@ -6,8 +6,6 @@ from application.app import app as flask_app
 @pytest.fixture
 def client():
     flask_app.config['TESTING'] = True
-    # Use a short secret key to allow sessions in tests if needed
-    flask_app.secret_key = flask_app.secret_key or 'test-secret'
     with flask_app.test_client() as client:
         yield client
 
@@ -62,3 +60,122 @@ def test_admin_login_logout_flow(client):
     # Logout should redirect back to index
     r4 = client.get('/admin/logout', follow_redirects=False)
     assert r4.status_code in (302, 301)
+
+
+def test_admin_login_disabled_without_password(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_PASSWORD")
+    r = client.post('/admin/login', data={'password': '123'}, follow_redirects=False)
+    assert r.status_code == 200 and b'ADMIN_PASSWORD' in r.data
+
+
+def test_app_refuses_to_start_without_secret_key():
+    import os
+    import subprocess
+    import sys
+    # empty values also keep a developer's application/.env from filling them in
+    env = dict(os.environ, FLASK_SECRET_KEY="", FLASK_DEBUG="0")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    r = subprocess.run([sys.executable, "-c", "import application.app"], env=env, cwd=root,
+                       capture_output=True, text=True)
+    assert r.returncode != 0 and "FLASK_SECRET_KEY" in r.stderr
+
+
+def test_per_user_admin_routes_require_login(client):
+    for path in ('/admin', '/admin/users', '/admin/export?user_id=u1'):
+        assert client.get(path, follow_redirects=False).status_code in (302, 301)
+    r = client.post('/admin/clear', data={'user_id': 'u1'}, follow_redirects=False)
+    assert r.status_code in (302, 301)
+
+
+def test_admin_export_all_requires_login_and_streams_gzip(client, tmp_path, monkeypatch):
+    import gzip
+    import json
+    from application.functions import db_handler
+
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "export.db"))
+    db_handler.init_db()
+    db_handler.add_user("u1", "")
+    db_handler.add_event("u1", "chat_user", "hello")
+
+    r = client.get('/admin/export_all', follow_redirects=False)
+    assert r.status_code in (302, 301)
+
+    client.post('/admin/login', data={'password': '123'})
+    r2 = client.get('/admin/export_all')
+    assert r2.status_code == 200
+    lines = gzip.decompress(r2.data).decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records[0] == {"type": "user", "id": "u1", "info": ""}
+    assert records[1]["content"] == "hello"
+
+
+def test_bot_rejects_oversized_image(client, monkeypatch):
+    import io
+    from application.app import ai_handler_instance
+
+    monkeypatch.setattr(ai_handler_instance, "max_image_bytes", 10)
+    client.set_cookie('user_id', 'size-test')
+    r = client.post('/bot', data={'image': (io.BytesIO(b'x' * 100), 'big.jpg')},
+                    content_type='multipart/form-data')
+    assert r.status_code == 400
+    assert 'error' in r.get_json()
+
+
+def test_bot_audio_stream_chunks_and_finish(client, monkeypatch):
+    import numpy as np
+    from application.routes import main as main_routes
+
+    monkeypatch.setattr(main_routes.ai_handler_instance, "transcribe_pcm",
+                        lambda audio: f"{len(audio)} samples")
+    client.set_cookie('user_id', 'stt-test')
+    chunk = np.zeros(8000, dtype='<f4').tobytes()
+
+    r = client.post('/bot/audio/s1?seq=0&rate=16000', data=chunk,
+                    content_type='application/octet-stream')
+    assert r.status_code == 200
+    assert 'partial' in r.get_json()
+    r2 = client.post('/bot/audio/s1?seq=1&rate=16000', data=chunk,
+                     content_type='application/octet-stream')
+    assert r2.status_code == 200
+
+    r3 = client.post('/bot/audio/s1/finish')
+    assert r3.get_json() == {"text": "16000 samples"}
+    assert client.post('/bot/audio/s1/finish').status_code == 404
+    assert client.post('/bot/audio/s2?rate=16000', data=chunk).status_code == 400
+
+
+def test_streaming_voice_input_can_be_disabled(client, monkeypatch):
+    from application.functions import stt_stream
+    assert b'id="mic-btn"' in client.get('/bot').data
+
+    monkeypatch.setattr(stt_stream, "STREAMING_ENABLED", False)
+    client.set_cookie('user_id', 'u1')
+    assert b'id="mic-btn"' not in client.get('/bot').data
+    assert client.post('/bot/audio/s1?seq=0&rate=16000', data=b'\0' * 16).status_code == 404
+
+
+def test_bot_cancel_without_request_in_flight(client):
+    client.set_cookie('user_id', 'cancel-test')
+    r = client.post('/bot/cancel')
+    assert r.get_json() == {"cancelled": False}
+
+    r2 = client.get('/ai/metrics')
+    assert r2.status_code == 200
+    assert 'seconds_saved_estimate' in r2.get_json()['metrics']
+
+
+def test_api_batch_requires_auth_and_streams_results(client, monkeypatch):
+    import json
+    from application.routes import api as api_routes
+
+    monkeypatch.setattr(api_routes.ai_handler_instance, "complete", lambda model, prompt: prompt.upper())
+    body = '{"id": "q1", "prompt": "hi"}\n{"id": "q2", "prompt": "yo"}\n'
+
+    assert client.post('/api/batch', data=body).status_code == 401
+
+    monkeypatch.setenv("BATCH_API_TOKEN", "secret")
+    r = client.post('/api/batch?start=1', data=body, headers={'Authorization': 'Bearer secret'})
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.data.decode('utf-8').splitlines()]
+    assert lines[0]["id"] == "q2" and lines[0]["text"] == "YO"
+    assert lines[-1]["stats"]["ok"] == 1
@@ -0,0 +1,81 @@
+from application.functions import routing
+from application.functions.AI_handler import AIHandler
+from application.functions.deadline import Deadline
+
+
+def test_classify_tiers():
+    assert routing.classify("hi")[0] == "small"
+    assert routing.classify("Tack så mycket!")[0] == "small"
+    assert routing.classify("What is your name?")[0] == "small"
+    assert routing.classify("Can you derive the formula step by step?")[0] == "reasoning"
+    assert routing.classify("what is 12 * 34")[0] == "reasoning"
+    assert routing.classify("Why is this slow?\n```\nfor i in x: y()\n```")[0] == "reasoning"
+    assert routing.classify("def f(x):\n    return g(x);")[0] == "reasoning"
+    assert routing.classify("x" * 700)[0] == "reasoning"
+    assert routing.classify("hello", has_image=True)[0] == "medium"
+    long_chat = "Tell me a story about a dragon and a knight in a castle"
+    assert routing.classify(long_chat)[0] == "medium"
+
+
+def test_casual_questions_stay_off_the_reasoning_tier():
+    for message in [
+        "How does it feel to be a knight?",
+        "Compare your sword to mine!",
+        "Why does the king wear a crown?",
+        "Meet me at the castle gate at 10-11 tomorrow",
+        "Which class are you in the tournament, sir knight?",
+        "I fought three dragons today; the last one was the worst;",
+    ]:
+        assert routing.classify(message)[0] != "reasoning", message
+
+
+def test_reply_ok():
+    assert routing.reply_ok("Greetings, traveller! How may I help?", "hi")
+    assert not routing.reply_ok("", "hi")
+    assert not routing.reply_ok("(Fallback) You said: hi", "hi")
+    assert not routing.reply_ok("I'm not sure about that.", "what?")
+    assert not routing.reply_ok("Yes.", "Is the castle old?")
+
+
+def _fake_generate(replies, used_models):
+    def generate(model):
+        used_models.append(model)
+        return replies[model]
+    return generate
+
+
+def test_small_model_escalates_on_weak_reply():
+    handler = AIHandler({"small_chat_model": "small", "default_chat_model": "medium"})
+    used = []
+    replies = {"small": "I don't know", "medium": "The castle was built in 1250, good sir."}
+    generate = _fake_generate(replies, used)
+
+    reply = handler._routed_reply(generate, "when was it built", 0, False, False, Deadline(60))
+    assert used == ["small", "medium"]
+    assert reply == replies["medium"]
+
+
+def test_override_and_good_small_reply_do_not_escalate():
+    handler = AIHandler({"small_chat_model": "small", "default_chat_model": "medium"})
+    used = []
+    replies = {"small": "Hail, friend! Welcome to my hall.", "custom": "ok"}
+    generate = _fake_generate(replies, used)
+
+    assert handler._routed_reply(generate, "hi", 0, False, False, Deadline(60)) == replies["small"]
+    handler._routed_reply(generate, "hi", 0, False, False, Deadline(60), model_override="custom")
+    assert used == ["small", "custom"]
+
+
+def test_preload_models_warms_every_tier(monkeypatch):
+    from application.functions import AI_handler
+    loaded = []
+    monkeypatch.setattr(AI_handler.ollama, "generate", lambda model, **kwargs: loaded.append(model))
+    handler = AIHandler({"small_chat_model": "small", "default_chat_model": "medium",
+                         "default_reason_model": "big", "vision_model": "eyes", "routing": "1"})
+    handler.preload_models()
+    assert sorted(loaded) == ["big", "eyes", "medium", "small"]
+
+    loaded.clear()
+    AIHandler({"default_chat_model": "medium", "default_reason_model": "medium",
+               "vision_model": "eyes", "routing": "0"}).preload_models()
+    assert loaded == ["medium", "eyes"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from application.functions import stt_stream
+
+
+def _tone(seconds, rate, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def test_decode_pcm_round_trip_and_validation():
+    samples = np.array([0.0, 0.5, -1.0], dtype="<f4")
+    assert np.allclose(stt_stream.decode_pcm(samples.tobytes()), samples)
+    with pytest.raises(stt_stream.StreamError):
+        stt_stream.decode_pcm(b"abc")
+
+
+def test_resample_lengths():
+    assert len(stt_stream.resample(np.zeros(48000, np.float32), 48000)) == 16000
+    assert len(stt_stream.resample(np.zeros(44100, np.float32), 44100)) == 16000
+    same = np.ones(10, np.float32)
+    assert np.array_equal(stt_stream.resample(same, 16000), same)
+
+
+def test_find_cut_picks_quiet_gap():
+    rate = stt_stream.TARGET_RATE
+    audio = np.concatenate([_tone(3, rate), np.zeros(int(0.3 * rate), np.float32), _tone(0.7, rate)])
+    cut = stt_stream.find_cut(audio)
+    assert 3 * rate <= cut <= 3.3 * rate
+
+
+def test_stream_reorders_chunks_and_commits_segments(monkeypatch):
+    monkeypatch.setattr(stt_stream, "SEGMENT_SECONDS", 2.0)
+    calls = []
+
+    def fake_transcribe(audio):
+        calls.append(len(audio))
+        return f"[{len(audio)}]"
+
+    stream = stt_stream.AudioStream(48000, fake_transcribe)
+    chunks = [_tone(0.5, 48000) for _ in range(6)]
+    # deliver out of order; nothing is appended until seq 0 arrives
+    stream.add_chunk(1, chunks[1])
+    assert stream.total_samples == 0
+    stream.add_chunk(0, chunks[0])
+    stream.add_chunk(0, chunks[0])  # duplicate is ignored
+    assert stream.total_samples == 16000
+    for seq in range(2, 6):
+        stream.add_chunk(seq, chunks[seq])
+        if stream.job is not None:
+            stream.job.result()
+
+    text = stream.finish()
+    assert stream.total_samples == 48000
+    assert text
+    # every received sample was transcribed exactly once in committed + final text
+    pieces = [int(p.strip("[]")) for p in text.split()]
+    assert sum(pieces) == 48000
+
+
+def test_stream_rejects_overlong_recordings(monkeypatch):
+    monkeypatch.setattr(stt_stream, "MAX_STREAM_SECONDS", 1.0)
+    stream = stt_stream.AudioStream(16000, lambda audio: "")
+    with pytest.raises(stt_stream.StreamError):
+        stream.add_chunk(0, np.zeros(20000, np.float32))
+    # Chunks held back behind a missing seq count against the limit too
+    stream = stt_stream.AudioStream(16000, lambda audio: "")
+    with pytest.raises(stt_stream.StreamError):
+        stream.add_chunk(1, np.zeros(20000, np.float32))
+
+
+def test_stream_bounds_out_of_order_window_and_fills_gaps():
+    stream = stt_stream.AudioStream(16000, lambda audio: f"[{len(audio)}]")
+    with pytest.raises(stt_stream.StreamError):
+        stream.add_chunk(stt_stream.MAX_OUT_OF_ORDER + 1, np.zeros(10, np.float32))
+
+    stream.add_chunk(0, np.zeros(100, np.float32))
+    stream.add_chunk(2, np.zeros(200, np.float32))  # seq 1 never arrives
+    assert stream.finish() == "[300]"
+    assert stream.missing == [1]
+
+
+def test_registry_limits_streams_per_user():
+    registry = stt_stream.StreamRegistry()
+    for i in range(stt_stream.MAX_STREAMS_PER_USER):
+        registry.get_or_create(("u1", f"s{i}"), 16000, lambda audio: "")
+    with pytest.raises(stt_stream.StreamError):
+        registry.get_or_create(("u1", "extra"), 16000, lambda audio: "")
+    registry.get_or_create(("u2", "s0"), 16000, lambda audio: "")